@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import numpy as np
+from resampling import resample_counts
+
+SCORES = ["Precision", "Recall", "F1", "AER"]
+
+
+def read_links(path: str, gold: bool = False) -> tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Parse a file of "i-j" links (gold files mark possible links as "ipj") with one sentence per line.
+    Returns the number of sentences, then the sentence, source and target index of every link and whether it is a sure link."""
+    lengths = []
+    tokens = []
+    with open(path, "r") as f:
+        for line in f:
+            links = line.strip().split()
+            # Same as alignment_score.calc_score(): drop the extra fields of the links (e.g. probabilities)
+            if not gold and links and len(links[0].split("-")) > 2:
+                links = ["-".join(x.split("-")[:2]) for x in links]
+            lengths.append(len(links))
+            tokens.extend(links)
+    sentences = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    sure = np.array(["p" not in token for token in tokens], dtype=bool)
+    pairs = np.array(" ".join(tokens).replace("p", " ").replace("-", " ").split(), dtype=np.int64).reshape(-1, 2)
+    return len(lengths), sentences, pairs[:, 0], pairs[:, 1], sure
+
+
+class LinkSet:
+    """The distinct links of each sentence as sorted i * maxlen + j keys, in CSR layout:
+    the keys of sentence n are keys[offsets[n]:offsets[n + 1]]."""
+    def __init__(self, sentences: np.ndarray, src: np.ndarray, trg: np.ndarray, n_sentences: int, maxlen: int):
+        # The sentence goes in the high part of the key, so one sort groups and orders the links of all the sentences
+        keys = np.sort((sentences * maxlen + src) * maxlen + trg)
+        if len(keys):
+            keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]
+        self.sentences = keys // (maxlen * maxlen)
+        self.keys = keys % (maxlen * maxlen)
+        self.offsets = np.searchsorted(self.sentences, np.arange(n_sentences + 1))
+        self.maxlen = maxlen
+
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def global_keys(self) -> np.ndarray:
+        return self.sentences * self.maxlen * self.maxlen + self.keys
+
+    def hits(self, other: "LinkSet") -> np.ndarray:
+        """Number of links of each sentence that are also in the same sentence of `other`."""
+        keys, other_keys = self.global_keys(), other.global_keys()
+        if not len(other_keys):
+            return np.zeros(len(self.offsets) - 1, dtype=np.int64)
+        # Both key arrays are sorted, the intersection is a binary search
+        found = other_keys[np.minimum(np.searchsorted(other_keys, keys), len(other_keys) - 1)] == keys
+        return np.bincount(self.sentences[found], minlength=len(self.offsets) - 1)
+
+
+def link_sets(gold_path: str, system_paths: list[str]) -> tuple[LinkSet, LinkSet, list[LinkSet]]:
+    """The possible (sure included) and sure gold links and the links of every system, with a shared key space."""
+    gold = read_links(gold_path, gold=True)
+    systems = [read_links(path) for path in system_paths]
+    n_sentences = gold[0]
+    for path, system in zip(system_paths, systems):
+        if system[0] > n_sentences:
+            raise ValueError(f"{path} has more sentences than the gold standard ({n_sentences})")
+    maxlen = 1 + max([0] + [int(indexes.max()) for links in [gold, *systems] for indexes in links[2:4] if len(indexes)])
+
+    _, sentences, src, trg, sure = gold
+    possible = LinkSet(sentences, src, trg, n_sentences, maxlen)
+    sure = LinkSet(sentences[sure], src[sure], trg[sure], n_sentences, maxlen)
+    return possible, sure, [LinkSet(sentences, src, trg, n_sentences, maxlen) for _, sentences, src, trg, _ in systems]
+
+
+def sentence_counts(possible: LinkSet, sure: LinkSet, system: LinkSet) -> np.ndarray:
+    """(n_sentences, 4) matrix of the possible hits, sure hits, system links and sure gold links of every sentence."""
+    return np.stack([system.hits(possible), system.hits(sure), system.counts(), sure.counts()], axis=1)
+
+
+def scores_from_counts(counts: np.ndarray) -> np.ndarray:
+    """Unrounded precision, recall, F1 and AER from rows of summed sentence_counts()."""
+    p_hit, s_hit, total_hit, surs_count = counts.T.astype(np.float64)
+    prec = p_hit / np.maximum(total_hit, 1.)
+    rec = s_hit / np.maximum(surs_count, 1.)
+    f1 = 2. * prec * rec / np.maximum(prec + rec, 0.01)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aer = 1 - (s_hit + p_hit) / (total_hit + surs_count)
+    return np.stack([prec, rec, f1, aer], axis=-1)
+
+
+def point_scores(counts: np.ndarray) -> dict:
+    """Same numbers as alignment_score.calc_score(), rounded the same way."""
+    p_hit, s_hit, total_hit, surs_count = (float(x) for x in counts.sum(axis=0))
+    y_prec = round(p_hit / max(total_hit, 1.), 3)
+    y_rec = round(s_hit / max(surs_count, 1.), 3)
+    y_f1 = round(2. * y_prec * y_rec / max((y_prec + y_rec), 0.01), 3)
+    aer = round(1 - (s_hit + p_hit) / (total_hit + surs_count), 3)
+    return dict(zip(SCORES, [y_prec, y_rec, y_f1, aer]))
+
+
+def score_systems(gold_path: str, system_paths: list[str], num_resamples: int = 1000, confidence_level: float = 0.95, seed: int = 42) -> dict:
+    """Scores of every system with percentile bootstrap intervals.
+    The sentences are resampled once and the same resamples are used for all the systems (paired bootstrap)."""
+    possible, sure, systems = link_sets(gold_path, system_paths)
+    n_sentences = len(possible.offsets) - 1
+    rng = np.random.default_rng(seed)
+    idxs = rng.integers(0, n_sentences, (num_resamples, n_sentences))
+    # How many times each sentence is drawn in each resample, so that every resample is summed with one product
+    resamples = resample_counts(idxs, n_sentences).astype(np.float64)
+
+    counts = [sentence_counts(possible, sure, system) for system in systems]
+    bs_counts = resamples @ np.concatenate(counts, axis=1).astype(np.float64)
+    alpha = (1 - confidence_level) / 2
+    results = {}
+    for k, path in enumerate(system_paths):
+        scores = point_scores(counts[k])
+        bs_scores = scores_from_counts(bs_counts[:, 4 * k:4 * (k + 1)])
+        ci_low, ci_high = np.quantile(bs_scores, [alpha, 1 - alpha], axis=0)
+        scores["bootstrap"] = {
+            name: {"mean": float(bs_scores[:, m].mean()), "std": float(bs_scores[:, m].std(ddof=1)), "ci_low": float(ci_low[m]), "ci_high": float(ci_high[m])}
+            for m, name in enumerate(SCORES)
+        }
+        results[path] = scores
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score several alignment files against the gold standard, with bootstrap confidence intervals.")
+    parser.add_argument("gold_path")
+    parser.add_argument("input_paths", nargs="+")
+    parser.add_argument("--output", "-o", type=str, required=True, help="JSON file with the scores of every input file")
+    parser.add_argument("--num_resamples", type=int, default=1000)
+    parser.add_argument("--confidence_level", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    results = score_systems(args.gold_path, args.input_paths, args.num_resamples, args.confidence_level, args.seed)
+    for path, scores in results.items():
+        print("{}\tPrec: {}\tRec: {}\tF1: {}\tAER: {}".format(path, *(scores[name] for name in SCORES)))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
@@ -48,6 +48,22 @@ def calc_score(input_path, probs, surs, surs_count):
 
 	return y_prec, y_rec, y_f1, aer
 
+def score_file(gold_path, input_path, output_path):
+	"""Score an alignment file against the gold standard and write the scores as JSON."""
+	probs, surs, surs_count = load_gold(gold_path)
+	y_prec, y_rec, y_f1, aer = calc_score(input_path, probs, surs, surs_count)
+
+	print("Prec: {}\tRec: {}\tF1: {}\tAER: {}".format(y_prec, y_rec, y_f1, aer))
+	scores = {
+		"Precision": y_prec,
+		"Recall": y_rec,
+		"F1": y_f1,
+		"AER": aer
+	}
+	with open(output_path, "w") as out_f:
+		json.dump(scores, out_f, indent=2)
+	return scores
+
 
 if __name__ == "__main__":
 	'''
@@ -70,15 +86,4 @@ if __name__ == "__main__":
 		print("The input file does not exist:\n", args.input_path)
 		exit()
 
-	probs, surs, surs_count = load_gold(args.gold_path)
-	y_prec, y_rec, y_f1, aer = calc_score(args.input_path, probs, surs, surs_count)
-
-	print("Prec: {}\tRec: {}\tF1: {}\tAER: {}".format(y_prec, y_rec, y_f1, aer))
-	scores = {
-		"Precision": y_prec,
-		"Recall": y_rec,
-		"F1": y_f1,
-		"AER": aer
-	}
-	with open(args.output_path, "w") as out_f:
-		json.dump(scores, out_f, indent=2)
+	score_file(args.gold_path, args.input_path, args.output_path)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Compare the throughput of the plain text-generation pipeline with the length-bucketed batched generation.
+"""
+import json
+import time
+from eval_data import load_split
+import torch
+import transformers
+from generation import BatchedPipeline
+from translation_task import LANG_NAMES, fmt
+
+def throughput(model, msgs, tokenizer, max_new_tokens: int) -> dict[str, float]:
+    start = time.perf_counter()
+    answers = [answer[-1]['generated_text'][-1]['content'] for answer in model(iter(msgs), do_sample=False, max_new_tokens=max_new_tokens)]
+    elapsed = time.perf_counter() - start
+    tokens = sum(len(tokenizer(answer, add_special_tokens=False)['input_ids']) for answer in answers)
+    return {
+        "seconds": elapsed,
+        "sentences": len(answers),
+        "generated_tokens": tokens,
+        "sentences_per_s": len(answers) / elapsed,
+        "tokens_per_s": tokens / elapsed,
+    }
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', '-m', type=str, required=True, help="Model ID")
+    parser.add_argument('--input', '-i', type=str, default="data/pms_dev.arrow")
+    parser.add_argument('--direction', type=str, default="ita_pms", help="Translation direction used for the prompts")
+    parser.add_argument('--samples', type=int, default=128, help="Number of prompts")
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--token_budget', type=int, default=None)
+    parser.add_argument('--max_new_tokens', type=int, default=100)
+    parser.add_argument('--output', '-o', type=str, default=None, help="Optional JSON file with the results")
+    args = parser.parse_args()
+
+    ds = load_split(args.input)
+    from_, to_ = args.direction.split("_")
+    from_lang = LANG_NAMES[from_]
+    to_lang = LANG_NAMES[to_]
+    system_prompt = (
+        f"You are a helpful assistant that translates the following sentence from {from_lang} to {to_lang}. "
+        "Do not add any explanations."
+    )
+    user_prompt = f"Translate the following {from_lang} source text to {to_lang}:\n{from_lang}: {{}}\n{to_lang}: "
+    msgs = list(fmt(ds[f'flores_{from_}'][:args.samples], system_prompt, user_prompt))
+
+    pipe = transformers.pipeline("text-generation", model=args.model, device_map="auto", dtype=torch.bfloat16)
+    results = {"pipeline": throughput(pipe, msgs, pipe.tokenizer, args.max_new_tokens)}
+    print("pipeline", results["pipeline"])
+    for batch_size in args.batch_sizes:
+        batched = BatchedPipeline(pipe, batch_size=batch_size, token_budget=args.token_budget)
+        results[f"batched_{batch_size}"] = throughput(batched, msgs, pipe.tokenizer, args.max_new_tokens)
+        print(f"batched_{batch_size}", results[f"batched_{batch_size}"])
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,33 +1,65 @@
 #!/usr/bin/env python3
-import evaluate
 import json
 import pandas as pd
 import numpy as np
-from scipy.stats import bootstrap
+from resampling import bca_interval, resample_counts
 
 CATEGORIES = ["science/technology", "travel", "politics", "sports", "health", "entertainment", "geography"]
 CAT_TO_ID = {cat: idx for idx, cat in enumerate(CATEGORIES)}
+METRICS = ["accuracy", "f1", "precision", "recall"]
 
-def bootstrap_confidence_interval(metric, key, predictions, references, num_resamples=1000, confidence_level=0.95, seed=42, **kargs):
-    def call_metric(*args):
-        ref = args[0]
-        pred = args[1]
-
-        result = metric.compute(predictions=pred, references=ref, **kargs)
-        return result[key]
-
-    bs = bootstrap(
-        data=(references, predictions),
-        statistic=call_metric,
-        vectorized=False,
-        n_resamples=num_resamples,
-        confidence_level=confidence_level,
-        paired=True,
-        rng=seed,
-    )
-    std = bs.standard_error
-    ci_low, ci_high = bs.confidence_interval
-    return {"std": std, "ci_low": ci_low, "ci_high": ci_high}
+def cell_onehot(references: np.ndarray, predictions: np.ndarray) -> np.ndarray:
+    """(n, K * K) indicator of the confusion cell of each item, class 0 being "not a category" (-1)."""
+    n_classes = len(CATEGORIES) + 1
+    cells = (references + 1) * n_classes + (predictions + 1)
+    onehot = np.zeros((len(cells), n_classes * n_classes))
+    onehot[np.arange(len(cells)), cells] = 1
+    return onehot
+
+def confusion_matrices(references: np.ndarray, predictions: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """(n_resamples, K, K) confusion matrices, row = reference, column = prediction, class 0 being "not a category" (-1).
+    `counts` gives how many times each item is drawn in each resample."""
+    n_classes = len(CATEGORIES) + 1
+    # One indicator column per confusion cell, so that all the resamples are summed with a single product
+    return (counts @ cell_onehot(references, predictions)).reshape(-1, n_classes, n_classes)
+
+def micro_metrics(confusion: np.ndarray) -> np.ndarray:
+    """Accuracy, and micro F1/precision/recall over CATEGORIES (like sklearn with labels=CATEGORIES), as a (4, n_resamples) array."""
+    n = confusion.sum(axis=(1, 2))
+    correct = np.trace(confusion, axis1=1, axis2=2)
+    true_positives = correct - confusion[:, 0, 0]
+    predicted = confusion[:, :, 1:].sum(axis=(1, 2))
+    actual = confusion[:, 1:, :].sum(axis=(1, 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        accuracy = correct / n
+        # sklearn's zero_division="warn" returns 0
+        precision = np.where(predicted > 0, true_positives / predicted, 0.0)
+        recall = np.where(actual > 0, true_positives / actual, 0.0)
+        f1 = np.where(predicted + actual > 0, 2 * true_positives / (predicted + actual), 0.0)
+    return np.stack([accuracy, f1, precision, recall])
+
+def bootstrap_confidence_intervals(predictions: list[int], references: list[int], num_resamples=1000, confidence_level=0.95, seed=42) -> dict:
+    """Same resamples and BCa intervals as scipy.stats.bootstrap(paired=True, rng=seed) for the four METRICS,
+    computed from one index matrix and per-resample confusion matrices."""
+    predictions = np.asarray(predictions)
+    references = np.asarray(references)
+    n = len(predictions)
+    idxs = np.random.default_rng(seed).integers(0, n, (num_resamples, n))
+    counts = resample_counts(idxs, n)
+
+    n_classes = len(CATEGORIES) + 1
+    onehot = cell_onehot(references, predictions).reshape(n, n_classes, n_classes)
+    full = onehot.sum(axis=0, keepdims=True)
+    theta_hat = micro_metrics(full)[:, 0]
+    theta_hat_b = micro_metrics(confusion_matrices(references, predictions, counts))
+    # Leave-one-out confusion matrices for the acceleration term: each one is the full matrix minus the item's cell
+    theta_hat_jack = micro_metrics(full - onehot)
+    ci_low, ci_high = bca_interval(theta_hat, theta_hat_b, theta_hat_jack, confidence_level)
+    std = theta_hat_b.std(axis=-1, ddof=1)
+    return {
+        metric: {"score": theta_hat[k], "std": std[k], "ci_low": ci_low[k], "ci_high": ci_high[k]}
+        for k, metric in enumerate(METRICS)
+    }
 
 if __name__ == "__main__":
     import argparse
@@ -36,28 +68,13 @@ if __name__ == "__main__":
     parser.add_argument('--output', '-o', type=str, required=True, help="Output score file")
     args = parser.parse_args()
 
-    accuracy = evaluate.load("accuracy")
-    f1 = evaluate.load("f1") # labels=CATEGORIES, average='micro'
-    precision = evaluate.load("precision") # labels=CATEGORIES, average='micro'
-    recall = evaluate.load("recall") # labels=CATEGORIES, average='micro'
-
     df = pd.concat([pd.read_json(f, lines=True) for f in args.input])
     answers = list(df['predicted_category'])
     labels = list(df['true_category'])
 
-    scores = {}
     answers_idx = [CAT_TO_ID.get(cat, -1) for cat in answers]
     labels_idx = [CAT_TO_ID.get(cat, -1) for cat in labels]
-
-    scores['accuracy'] = {"score": accuracy.compute(predictions=answers_idx, references=labels_idx)['accuracy']}
-    scores['f1'] = {"score": f1.compute(predictions=answers_idx, references=labels_idx, average='micro', labels=list(CAT_TO_ID.values()))['f1']}
-    scores['precision'] = {"score": precision.compute(predictions=answers_idx, references=labels_idx, average='micro', labels=list(CAT_TO_ID.values()))['precision']}
-    scores['recall'] = {"score": recall.compute(predictions=answers_idx, references=labels_idx, average='micro', labels=list(CAT_TO_ID.values()))['recall']}
-
-    kargs = {"average": 'micro', "labels": list(CAT_TO_ID.values())}
-    for metric_name, metric in zip(["f1", "precision", "recall"], [f1, precision, recall]):
-        scores[metric_name].update(bootstrap_confidence_interval(metric, metric_name, answers_idx.copy(), labels_idx.copy(), **kargs))
-    scores['accuracy'].update(bootstrap_confidence_interval(accuracy, key='accuracy', predictions=answers_idx.copy(), references=labels_idx.copy()))
+    scores = bootstrap_confidence_intervals(answers_idx, labels_idx)
 
     with open(args.output, "w") as f:
         json.dump(scores, f, indent=2)
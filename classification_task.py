@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
-import transformers
-import datasets
+from eval_data import load_eval_dataset
 import torch
 import pandas as pd
-from closed_models import ClosedModel, CLOSED_MODELS
+from generation import add_model_args, load_model, base_pipeline, generate_resumable, remove_partials
 
 CATEGORIES = ["science/technology", "travel", "politics", "sports", "health", "entertainment", "geography"]
 KEYWORDS_MAP = {
@@ -23,30 +22,41 @@ def extract_category(prediction: str, category_map: dict[str, str]) -> str:
             return category
     return "unknown"
 
-if __name__ == "__main__":
-    import argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--model', '-m', type=str, required=True, help="Model ID")
-    parser.add_argument('--lang', '-l', type=str, choices=['ita', 'pms', 'fra', 'eng'], required=True, help="Language to classify")
-    parser.add_argument('--output_file', '-o', type=str, required=True, help="Output file prefix")
-    args = parser.parse_args()
+class LabelScorer:
+    """Score every label as a continuation of the chat prompt, the prompt is encoded once and its KV cache is shared by all the labels."""
+    def __init__(self, pipe, labels: list[str]):
+        self.model = pipe.model
+        self.tokenizer = pipe.tokenizer
+        self.labels = labels
+        self.label_ids = [self.tokenizer(label, add_special_tokens=False)['input_ids'] for label in labels]
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else 0
+        max_len = max(len(ids) for ids in self.label_ids)
+        # Right padding is harmless: the model is causal and the padded positions are never scored
+        self.candidates = torch.tensor([ids + [pad_id] * (max_len - len(ids)) for ids in self.label_ids])
 
+    @torch.no_grad()
+    def __call__(self, msgs):
+        candidates = self.candidates.to(self.model.device)
+        for msg in msgs:
+            prompt_ids = self.tokenizer.apply_chat_template(msg, tokenize=True, add_generation_prompt=True, return_tensors="pt").to(self.model.device)
+            prompt_out = self.model(input_ids=prompt_ids, use_cache=True)
+            first_logprobs = prompt_out.logits[0, -1].float().log_softmax(-1)
+            cache = prompt_out.past_key_values
+            cache.batch_repeat_interleave(len(self.labels))
+            logprobs = self.model(input_ids=candidates, past_key_values=cache, use_cache=False).logits.float().log_softmax(-1)
+            scores = {}
+            for k, (label, ids) in enumerate(zip(self.labels, self.label_ids)):
+                score = first_logprobs[ids[0]] + sum(logprobs[k, t - 1, ids[t]] for t in range(1, len(ids)))
+                scores[label] = float(score)
+            yield scores
 
-    ds = datasets.load_dataset(
-        "json", 
-        data_files={"dev": "data/pms_dev.jsonl", "devtest": "data/pms_devtest.jsonl"},
-    )
-    ds = ds.filter(lambda x: x['category'] != 'uncategorized')
-    
-    model_id = args.model
-    lang = args.lang
-    output_file = args.output_file
+def run_classification(model, ds, lang: str, output_file: str, scoring: str = "generate") -> list[str]:
+    """Classify both splits in one language and write one checkpoint per split.
+    Returns the partial files, see remove_partials()."""
+    partial_paths = []
+    # In memory: the datasets are backed by the shared data/pms_*.arrow files, next to which filter() would write its cache files
+    ds = ds.filter(lambda x: x['category'] != 'uncategorized', keep_in_memory=True)
 
-    if model_id in CLOSED_MODELS:
-        model = ClosedModel(model_id)
-    else:
-        model = transformers.pipeline("text-generation", model=model_id, device_map="auto", dtype=torch.bfloat16)
-    
     system_prompt = (
         "You are a helpful assistant that classifies the following sentence into one of the following categories:"
         "science/technology, travel, politics, sports, health, entertainment, geography." 
@@ -82,11 +92,44 @@ if __name__ == "__main__":
         answers = []
         labels = list(ds[split]['category'])
         full_outputs = []
-        for answer in model(fmt(ds[split][f'flores_{lang}']), do_sample=False, max_new_tokens=100):
-            generated = answer[-1]['generated_text'][-1]['content'].strip()
-            full_outputs.append(generated)
-            answer = extract_category(generated, KEYWORDS_MAP)
-            answers.append(answer)
+        if scoring == "loglik":
+            label_scores = list(LabelScorer(base_pipeline(model), CATEGORIES)(fmt(ds[split][f'flores_{lang}'])))
+            answers = [max(scores, key=scores.get) for scores in label_scores]
+            full_outputs = answers
+        else:
+            # Each distinct sentence is generated once and streamed to the partial file, so a restart resumes from there
+            unique = list(dict.fromkeys(sentences))
+            partial_path = f"{output_file}.{lang}.{split}.jsonl.partial"
+            partial_paths.append(partial_path)
+            generated = generate_resumable(model, list(fmt(unique)), unique, partial_path, do_sample=False, max_new_tokens=100)
+            for sentence in sentences:
+                full_outputs.append(generated[sentence].strip())
+                answers.append(extract_category(full_outputs[-1], KEYWORDS_MAP))
             
         df = pd.DataFrame({'sentence': sentences, 'predicted_category': answers, 'true_category': labels, 'answer': full_outputs})
-        df.to_json(f"{output_file}.{lang}.{split}.jsonl", orient='records', lines=True)
\ No newline at end of file
+        if scoring == "loglik":
+            df['label_logprobs'] = label_scores
+        df.to_json(f"{output_file}.{lang}.{split}.jsonl", orient='records', lines=True)
+    return partial_paths
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', '-m', type=str, required=True, help="Model ID")
+    parser.add_argument('--lang', '-l', type=str, choices=['ita', 'pms', 'fra', 'eng'], required=True, help="Language to classify")
+    parser.add_argument('--output_file', '-o', type=str, required=True, help="Output file prefix")
+    parser.add_argument('--scoring', type=str, choices=['generate', 'loglik'], default='generate', help="Generate an answer and match the keywords, or pick the most likely label (local models only)")
+    add_model_args(parser)
+    args = parser.parse_args()
+
+
+    ds = load_eval_dataset()
+    
+    model_id = args.model
+    lang = args.lang
+    output_file = args.output_file
+
+    model = load_model(model_id, args)
+
+    partial_paths = run_classification(model, ds, lang, output_file, args.scoring)
+    remove_partials(partial_paths)
@@ -3,9 +3,13 @@
 Remove private information from raw data before sharing.
 """
 import argparse
+import collections
+import functools
+import hashlib
 import json
-import glob
 import os
+from concurrent.futures import ProcessPoolExecutor
+from submissions import read_submission, submission_paths
 
 LANG_MAP = {
     "Piemontese": "Piedmontese",
@@ -77,9 +81,7 @@ EVALUATION_TO_SCORE = {
 def inv_map(d):
     return {v: k for k, v in d.items()}
 
-def clean_file(file_path, out_dir):
-    with open(file_path) as f:
-        data = json.load(f)
+def clean_data(data):
     del data['group']
     del data['data']['feedback']
     data['data']['daily-language'] = LANG_MAP.get(data['data']['daily-language'], data['data']['daily-language'])
@@ -92,17 +94,37 @@ def clean_file(file_path, out_dir):
     data['data']['translation-evaluation-score'] = EVALUATION_TO_SCORE.get(data['data']['translation-evaluation'], -1)
     data['data']['translation-evaluation'] = EVALUATION_MAP.get(data['data']['translation-evaluation'], data['data']['translation-evaluation'])
     data['review_data']['selected_path'] = os.path.basename(data['review_data']['selected_path'])
-    
+    return data
+
+def sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+def clean_file(file_path, out_dir, resume=False):
+    """Write the cleaned copy of a raw file, returns "written", "rewritten" or "skipped".
+    With `resume`, an existing output with the expected content is skipped and any other one is replaced."""
+    content = json.dumps(clean_data(read_submission(file_path)), indent=2).encode('utf-8')
     out_path = os.path.join(out_dir, os.path.basename(file_path))
+    status = "written"
     if os.path.exists(out_path):
-        raise ValueError(f"Output file {out_path} already exists")
-    with open(out_path, 'w') as f:
-        json.dump(data, f, indent=2)    
+        if not resume:
+            raise ValueError(f"Output file {out_path} already exists")
+        with open(out_path, 'rb') as f:
+            if sha256(f.read()) == sha256(content):
+                return "skipped"
+        status = "rewritten"
+    # Write next to the output and rename, so an interrupted run never leaves a truncated file
+    tmp_path = os.path.join(out_dir, f".{os.path.basename(file_path)}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, out_path)
+    return status
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('input_folder', type=str, help='Input folder with raw JSON files')
     parser.add_argument('output_folder', type=str, help='Output folder for cleaned JSON files')
+    parser.add_argument('--workers', type=int, default=None, help='Processes cleaning the files (default: all cores)')
+    parser.add_argument('--resume', action='store_true', help='Skip the outputs that already have the expected content instead of failing on existing files')
     parser.add_argument('--map-json', type=str, default=None, help='Optional JSON file with custom mapping for cleaning')
     args = parser.parse_args()
 
@@ -111,9 +133,15 @@ if __name__ == "__main__":
     
     os.makedirs(args.output_folder, exist_ok=True)
 
-    files = glob.glob(os.path.join(args.input_folder, '*.json'))
-    for file_path in files:
-        clean_file(file_path, args.output_folder)
+    files = submission_paths(args.input_folder, '*.json')
+    clean = functools.partial(clean_file, out_dir=args.output_folder, resume=args.resume)
+    workers = args.workers or os.cpu_count() or 1
+    if workers <= 1:
+        statuses = collections.Counter(map(clean, files))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            statuses = collections.Counter(executor.map(clean, files, chunksize=64))
+    print(f"{len(files)} files: " + ", ".join(f"{count} {status}" for status, count in statuses.items()))
 
     if args.map_json is not None:
         maps = {
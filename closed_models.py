@@ -1,6 +1,10 @@
 from openai import OpenAI
 from google import genai
 import os
+import time
+import threading
+import collections
+import concurrent.futures
 import tiktoken
 import dotenv
 dotenv.load_dotenv()
@@ -11,33 +15,81 @@ CLOSED_MODELS = {
     "openai/gpt-4o-mini",
 }
 
+class RateLimiter:
+    """Sliding one-minute window over requests and (estimated) tokens."""
+    def __init__(self, rpm: int = None, tpm: int = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.lock = threading.Lock()
+        self.window = collections.deque() # (timestamp, tokens)
+        self.tokens = 0
+
+    def acquire(self, tokens: int):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.window and now - self.window[0][0] >= 60:
+                    self.tokens -= self.window.popleft()[1]
+                fits_rpm = self.rpm is None or len(self.window) < self.rpm
+                # A single request larger than the budget is let through on an empty window
+                fits_tpm = self.tpm is None or not self.window or self.tokens + tokens <= self.tpm
+                if fits_rpm and fits_tpm:
+                    self.window.append((now, tokens))
+                    self.tokens += tokens
+                    return
+                wait = 60 - (now - self.window[0][0])
+            time.sleep(wait)
+
 class ClosedModel:
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, concurrency: int = 1, rpm: int = None, tpm: int = None, max_retries: int = 5, base_url: str = None):
         self.model_name = model_name
+        self.concurrency = concurrency
+        # The client retries 408/409/429/5xx with exponential backoff (and honors Retry-After)
         self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
+            base_url=base_url or os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
             api_key=os.getenv("OPENROUTER_API_KEY"),
+            max_retries=max_retries,
+        )
+        self.limiter = RateLimiter(rpm, tpm)
+
+    def complete(self, msg, max_new_tokens):
+        prompt_tokens = sum(len(m["content"]) for m in msg) // 4 # rough estimate, good enough for the budget
+        self.limiter.acquire(prompt_tokens + max_new_tokens)
+        completion = self.client.chat.completions.create(
+            model=self.model_name,
+            max_completion_tokens=max_new_tokens,
+            temperature=0.0,
+            n=1,
+            messages=msg,
+            # extra_body={"reasoning": {
+            #     "effort": "low"
+            # }}
         )
-        
+        return completion.choices[0].message.content
+
     def __call__(self, msgs, do_sample=False, max_new_tokens=10):
         max_new_tokens = max(max_new_tokens, 16) # GPT-5 minimum
-        for msg in msgs:
-            completion = self.client.chat.completions.create(
-                model=self.model_name,
-                max_completion_tokens=max_new_tokens,
-                temperature=0.0,
-                n=1,
-                messages=msg,
-                # extra_body={"reasoning": {
-                #     "effort": "low"
-                # }}
-            )
-            answer = completion.choices[0].message.content
+        if self.concurrency <= 1:
+            answers = (self.complete(msg, max_new_tokens) for msg in msgs)
+        else:
+            answers = self._complete_concurrent(msgs, max_new_tokens)
+        for answer in answers:
             print(answer)
             yield [{
                 "generated_text": [{"content": answer}]
             }]
 
+    def _complete_concurrent(self, msgs, max_new_tokens):
+        # Keep up to `concurrency` requests in flight and a few more queued, but yield in input order
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = collections.deque()
+            for msg in msgs:
+                pending.append(pool.submit(self.complete, msg, max_new_tokens))
+                if len(pending) >= 2 * self.concurrency:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
 class GeminiTokenCounter:
     def __init__(self, model_name: str = "gemini-2.5-flash-preview-09-2025"):
         self.model_name = model_name
@@ -0,0 +1,21 @@
+import hashlib
+import json
+from sqlite_store import SQLiteStore
+
+
+class CometCache(SQLiteStore):
+    """SQLite store of segment-level COMET scores keyed by (source, hypothesis, reference, COMET model version)."""
+    def __init__(self, path: str, model_version: str):
+        super().__init__(path, "segments", "score", "REAL")
+        self.model_version = model_version
+
+    def key(self, triplet: tuple[str, str, str]) -> str:
+        payload = json.dumps([self.model_version, *triplet], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, triplets: list[tuple[str, str, str]]) -> dict[tuple[str, str, str], float]:
+        scores = {triplet: self.get(self.key(triplet)) for triplet in triplets}
+        return {triplet: score for triplet, score in scores.items() if score is not None}
+
+    def put_many(self, scores: dict[tuple[str, str, str], float]):
+        self.put_items([(self.key(triplet), float(score)) for triplet, score in scores.items()])
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import gzip
+import hashlib
+import json
+import os
+import random
+
+DATASET = "cis-lmu/Glot500"
+LANGS = ['pms_Latn', "ita_Latn", "fra_Latn", "eng_Latn"]
+MANIFEST = "manifest.json"
+
+
+def open_shard(path: str):
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, "r", encoding="utf-8")
+
+
+def write_shard(path: str, lines: list[str], compress: bool):
+    """Write the lines through a temporary file, gzip without timestamp and file name so that the bytes are reproducible."""
+    with open(path + ".tmp", "wb") as f:
+        if compress:
+            with gzip.GzipFile(filename="", mode="wb", fileobj=f, mtime=0) as gz:
+                gz.write("".join(lines).encode("utf-8"))
+        else:
+            f.write("".join(lines).encode("utf-8"))
+    os.replace(path + ".tmp", path)
+
+
+def sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def snapshot_config(samples: int, shards: int, seed: int, compress: bool, dataset: str = DATASET, langs: list[str] = LANGS) -> dict:
+    return {"dataset": dataset, "langs": langs, "samples": samples, "shards": shards, "seed": seed, "compress": compress}
+
+
+def load_manifest(directory: str) -> dict | None:
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def is_complete(directory: str, config: dict) -> bool:
+    """Whether the directory already has a snapshot with this configuration."""
+    manifest = load_manifest(directory)
+    return manifest is not None and manifest["config"] == config and all(
+        os.path.exists(os.path.join(directory, shard["path"])) for shard in manifest["shards"]
+    )
+
+
+def iter_sentences(dataset: str, langs: list[str], samples: int):
+    """The first `samples` texts of every language, streamed from the Hub, one line each."""
+    import datasets
+    for lang in langs:
+        ds = datasets.load_dataset(dataset, lang, split="train", streaming=True)
+        for _, sample in zip(range(samples), ds):
+            # A sentence per line: SentencePiece reads every line of the file input as a sentence
+            yield " ".join(sample['text'].splitlines())
+
+
+def write_snapshot(directory: str, config: dict) -> dict:
+    """Write the shuffled sentences in config["shards"] shard files and the manifest, which is written last.
+    Every sentence goes to a random shard, then every shard is shuffled in memory: only one shard is held at a time."""
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    rng = random.Random(config["seed"])
+    n_shards = config["shards"]
+    suffix = ".txt.gz" if config["compress"] else ".txt"
+
+    tmp_paths = [os.path.join(directory, f".shard-{k:05d}.tmp") for k in range(n_shards)]
+    tmp_files = [open(path, "w", encoding="utf-8") for path in tmp_paths]
+    try:
+        for sentence in iter_sentences(config["dataset"], config["langs"], config["samples"]):
+            tmp_files[rng.randrange(n_shards)].write(sentence + "\n")
+    finally:
+        for f in tmp_files:
+            f.close()
+
+    shards = []
+    for k, tmp_path in enumerate(tmp_paths):
+        with open(tmp_path, encoding="utf-8") as f:
+            lines = f.readlines()
+        rng.shuffle(lines)
+        name = f"shard-{k:05d}{suffix}"
+        write_shard(os.path.join(directory, name), lines, config["compress"])
+        os.remove(tmp_path)
+        shards.append({"path": name, "lines": len(lines), "sha256": sha256(os.path.join(directory, name))})
+
+    manifest = {"config": config, "lines": sum(shard["lines"] for shard in shards), "shards": shards}
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest
+
+
+def shard_paths(manifest_path: str) -> tuple[dict, list[str]]:
+    """The manifest and the paths of its shards."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(manifest_path)
+    return manifest, [os.path.join(directory, shard["path"]) for shard in manifest["shards"]]
+
+
+def iter_snapshot(manifest_path: str):
+    """Stream the sentences of a snapshot, shard by shard."""
+    _, paths = shard_paths(manifest_path)
+    for path in paths:
+        with open_shard(path) as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=f"Write a local, shuffled and sharded snapshot of {DATASET} with a manifest.")
+    parser.add_argument('output', type=str, help="Snapshot directory")
+    parser.add_argument('samples', type=int, help="Sentences per language")
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--compress', action='store_true', help="gzip the shards")
+    parser.add_argument('--force', action='store_true', help="Rewrite the snapshot even if it is complete")
+    args = parser.parse_args()
+
+    config = snapshot_config(args.samples, args.shards, args.seed, args.compress)
+    if not args.force and is_complete(args.output, config):
+        print(f"{args.output} is up to date")
+        exit()
+    for name in os.listdir(args.output) if os.path.isdir(args.output) else []:
+        if name.startswith("shard-") or name.startswith(".shard-"):
+            os.remove(os.path.join(args.output, name))
+    manifest = write_snapshot(args.output, config)
+    print(f"{manifest['lines']} sentences in {len(manifest['shards'])} shards")
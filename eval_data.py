@@ -0,0 +1,60 @@
+import os
+import pyarrow as pa
+import pyarrow.json
+
+SPLITS = ["dev", "devtest"]
+
+
+def arrow_path(jsonl_path: str) -> str:
+    """The Arrow copy written next to a JSONL file of the evaluation dataset."""
+    return os.path.splitext(jsonl_path)[0] + ".arrow"
+
+
+EVAL_FILES = {split: arrow_path(f"data/pms_{split}.jsonl") for split in SPLITS}
+
+
+def jsonl_to_arrow(content: bytes) -> bytes:
+    """Convert JSONL records to an Arrow IPC stream, the format datasets.Dataset.from_file() memory-maps."""
+    table = pyarrow.json.read_json(pa.BufferReader(content))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def load_table(paths: str | list[str]) -> pa.Table:
+    """Memory-map one or more Arrow files, the columns are not copied in memory."""
+    paths = [paths] if isinstance(paths, str) else paths
+    return pa.concat_tables([pa.ipc.open_stream(pa.memory_map(path)).read_all() for path in paths])
+
+
+def load_frame(paths: str | list[str]):
+    return load_table(paths).to_pandas()
+
+
+def load_split(paths: str | list[str]):
+    """Same as datasets.load_dataset("json", data_files=...)["train"] on the JSONL files, without parsing or caching."""
+    import datasets
+    paths = [paths] if isinstance(paths, str) else paths
+    return datasets.concatenate_datasets([datasets.Dataset.from_file(path) for path in paths])
+
+
+def load_eval_dataset(files: dict[str, str] = EVAL_FILES):
+    """The dev and devtest splits as a datasets.DatasetDict."""
+    import datasets
+    return datasets.DatasetDict({split: load_split(path) for split, path in files.items()})
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert a JSONL file of the evaluation dataset to the Arrow file read by the task scripts.")
+    parser.add_argument("input", type=str)
+    parser.add_argument("output", type=str, nargs="?", default=None, help="Defaults to the input path with the .arrow extension")
+    args = parser.parse_args()
+
+    output = args.output or arrow_path(args.input)
+    with open(args.input, "rb") as f:
+        content = jsonl_to_arrow(f.read())
+    with open(output + ".tmp", "wb") as f:
+        f.write(content)
+    os.replace(output + ".tmp", output)
@@ -0,0 +1,171 @@
+import copy
+import json
+import os
+from closed_models import ClosedModel, CLOSED_MODELS
+from generation_cache import GenerationCache, CachedModel, in_input_order, unordered_outputs
+
+
+class BatchedPipeline:
+    """Run a text-generation pipeline on length-sorted batches."""
+    def __init__(self, pipe, batch_size: int = 16, token_budget: int = None):
+        self.pipe = pipe
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        # Decoder-only models need left padding to generate a batch
+        if self.pipe.tokenizer.pad_token is None:
+            self.pipe.tokenizer.pad_token = self.pipe.tokenizer.eos_token
+        self.pipe.tokenizer.padding_side = "left"
+
+    def make_batches(self, lengths: list[int], max_new_tokens: int) -> list[list[int]]:
+        """Group prompt indexes, longest first, so each batch fits in batch_size and in the token budget."""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches = []
+        batch = []
+        for i in order:
+            if batch:
+                # The first prompt is the longest, so it sets the padded length of the batch
+                batch_tokens = (lengths[batch[0]] + max_new_tokens) * (len(batch) + 1)
+                if len(batch) >= self.batch_size or (self.token_budget is not None and batch_tokens > self.token_budget):
+                    batches.append(batch)
+                    batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def generate_unordered(self, msgs, do_sample=False, max_new_tokens=10):
+        """Yield (index, output) for every prompt of each batch as soon as the batch is done."""
+        msgs = list(msgs)
+        lengths = [len(self.pipe.tokenizer.apply_chat_template(msg, tokenize=True, add_generation_prompt=True)) for msg in msgs]
+        for batch in self.make_batches(lengths, max_new_tokens):
+            outputs = self.pipe([msgs[i] for i in batch], batch_size=len(batch), do_sample=do_sample, max_new_tokens=max_new_tokens)
+            yield from zip(batch, outputs)
+
+    def __call__(self, msgs, do_sample=False, max_new_tokens=10):
+        """The outputs in input order."""
+        yield from in_input_order(self.generate_unordered(msgs, do_sample=do_sample, max_new_tokens=max_new_tokens))
+
+
+class PrefixCachedPipeline:
+    """Generate one prompt at a time, reusing the KV cache of the prefix shared by all the prompts of a call."""
+    def __init__(self, pipe):
+        self.pipe = pipe
+
+    def __call__(self, msgs, do_sample=False, max_new_tokens=10):
+        import torch
+        import transformers
+        model = self.pipe.model
+        tokenizer = self.pipe.tokenizer
+        msgs = list(msgs)
+        if not msgs:
+            return
+        prompts = [tokenizer.apply_chat_template(msg, tokenize=True, add_generation_prompt=True) for msg in msgs]
+        # The system prompt and the instruction are the same for every sentence of a direction/task.
+        # Keep at least one token of each prompt out of the prefix, generate() needs an input to start from.
+        prefix_len = min(len(os.path.commonprefix(prompts)), min(len(prompt) for prompt in prompts) - 1)
+        prefix_cache = transformers.DynamicCache(config=model.config)
+        if prefix_len > 0:
+            with torch.no_grad():
+                model(input_ids=torch.tensor([prompts[0][:prefix_len]], device=model.device), past_key_values=prefix_cache, use_cache=True)
+        pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        for msg, prompt in zip(msgs, prompts):
+            input_ids = torch.tensor([prompt], device=model.device)
+            output = model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=copy.deepcopy(prefix_cache), # generate() extends the cache in place
+                do_sample=do_sample,
+                max_new_tokens=max_new_tokens,
+                pad_token_id=pad_token_id,
+            )
+            answer = tokenizer.decode(output[0, len(prompt):], skip_special_tokens=True)
+            yield [{
+                "generated_text": msg + [{"role": "assistant", "content": answer}]
+            }]
+
+
+def base_pipeline(model):
+    """Return the transformers pipeline under the batching and caching wrappers."""
+    while isinstance(model, (CachedModel, BatchedPipeline, PrefixCachedPipeline)):
+        model = model.model if isinstance(model, CachedModel) else model.pipe
+    if isinstance(model, ClosedModel):
+        raise ValueError(f"{model.model_name} does not expose its weights")
+    return model
+
+
+def load_partial(path: str) -> dict[str, str]:
+    """Read the answers appended to a partial file, dropping a last line truncated by a crash."""
+    answers = {}
+    if not os.path.exists(path):
+        return answers
+    valid_size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            answers[record["key"]] = record["answer"]
+            valid_size += len(line)
+    if valid_size < os.path.getsize(path):
+        os.truncate(path, valid_size)
+    return answers
+
+
+def generate_resumable(model, msgs: list, keys: list[str], partial_path: str = None, **kwargs) -> dict[str, str]:
+    """Generate the answer of each key, appending every finished answer to `partial_path`.
+    The answers are written as soon as the model returns them (e.g., a whole batch, whatever its position),
+    so the keys already in the partial file (e.g., from a preempted run) are not generated again."""
+    answers = load_partial(partial_path) if partial_path is not None else {}
+    todo = [(key, msg) for key, msg in zip(keys, msgs) if key not in answers]
+    if todo:
+        f = open(partial_path, "a") if partial_path is not None else None
+        try:
+            for k, answer in unordered_outputs(model, [msg for _, msg in todo], **kwargs):
+                key = todo[k][0]
+                answers[key] = answer[-1]['generated_text'][-1]['content']
+                if f is not None:
+                    f.write(json.dumps({"key": key, "answer": answers[key]}, ensure_ascii=False) + "\n")
+                    f.flush()
+        finally:
+            if f is not None:
+                f.close()
+    # Back in input order
+    return {key: answers[key] for key in keys}
+
+
+def remove_partials(paths: list[str]):
+    """Remove the partial files of a job once all its outputs are written.
+    Snakemake deletes all the outputs of a failed job, so the partial files are kept until every task of the job is done."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def add_model_args(parser):
+    parser.add_argument('--concurrency', type=int, default=1, help="Requests in flight for closed models")
+    parser.add_argument('--rpm', type=int, default=None, help="Requests per minute budget for closed models")
+    parser.add_argument('--tpm', type=int, default=None, help="Tokens per minute budget for closed models")
+    parser.add_argument('--cache', type=str, default=None, help="SQLite file caching the generations across runs")
+    parser.add_argument('--batch_size', type=int, default=1, help="Maximum number of prompts per batch for local models")
+    parser.add_argument('--token_budget', type=int, default=None, help="Maximum padded prompt + generated tokens per batch for local models")
+    parser.add_argument('--prefix_cache', action='store_true', help="Encode the prompt prefix shared by a task once and reuse its KV cache (local models, no batching)")
+
+
+def load_model(model_id: str, args):
+    """Load a closed model or a transformers pipeline, configured from the add_model_args() flags."""
+    if model_id in CLOSED_MODELS:
+        model = ClosedModel(model_id, concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm)
+    else:
+        if args.prefix_cache and args.batch_size > 1:
+            raise ValueError("--prefix_cache generates one prompt at a time, it cannot be combined with --batch_size")
+        import transformers
+        import torch
+        model = transformers.pipeline("text-generation", model=model_id, device_map="auto", dtype=torch.bfloat16)
+        if args.prefix_cache:
+            model = PrefixCachedPipeline(model)
+        elif args.batch_size > 1:
+            model = BatchedPipeline(model, batch_size=args.batch_size, token_budget=args.token_budget)
+    if args.cache is not None:
+        model = CachedModel(model, model_id, GenerationCache(args.cache))
+    return model
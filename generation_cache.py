@@ -0,0 +1,73 @@
+import hashlib
+import json
+from sqlite_store import SQLiteStore
+
+
+class GenerationCache(SQLiteStore):
+    """Content-addressed SQLite store of model answers."""
+    def __init__(self, path: str):
+        super().__init__(path, "generations", "answer", "TEXT")
+
+    @staticmethod
+    def key(model_id: str, messages: list[dict[str, str]], max_new_tokens: int, do_sample: bool) -> str:
+        payload = json.dumps({
+            "model": model_id,
+            "messages": messages,
+            "max_new_tokens": max_new_tokens,
+            "do_sample": do_sample,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def in_input_order(outputs):
+    """Turn (index, output) pairs arriving in any order into the outputs in index order, each released as soon as all the previous ones are there."""
+    pending = {}
+    next_index = 0
+    for index, output in outputs:
+        pending[index] = output
+        while next_index in pending:
+            yield pending.pop(next_index)
+            next_index += 1
+
+
+def unordered_outputs(model, msgs: list, **kwargs):
+    """Yield (index, output) as soon as each output is generated, in input order for the models that can only do that."""
+    if hasattr(model, "generate_unordered"):
+        yield from model.generate_unordered(msgs, **kwargs)
+    else:
+        yield from enumerate(model(iter(msgs), **kwargs))
+
+
+class CachedModel:
+    """Wrap a text-generation pipeline or a ClosedModel and only generate the answers missing from the cache."""
+    def __init__(self, model, model_id: str, cache: GenerationCache):
+        self.model = model
+        self.model_id = model_id
+        self.cache = cache
+
+    def generate_unordered(self, msgs, do_sample=False, max_new_tokens=10):
+        """Yield (index, output): first the cached answers, then the generated ones as soon as the model returns them."""
+        msgs = list(msgs)
+        keys = [self.cache.key(self.model_id, msg, max_new_tokens, do_sample) for msg in msgs]
+        cached = [self.cache.get(key) for key in keys]
+        misses = [i for i, answer in enumerate(cached) if answer is None]
+        print(f"Cache hits: {len(msgs) - len(misses)}/{len(msgs)}")
+        for i, answer in enumerate(cached):
+            if answer is not None:
+                yield i, self.output(msgs[i], answer)
+        if not misses:
+            return
+        for k, generated in unordered_outputs(self.model, [msgs[i] for i in misses], do_sample=do_sample, max_new_tokens=max_new_tokens):
+            i = misses[k]
+            answer = generated[-1]['generated_text'][-1]['content']
+            self.cache.put(keys[i], answer) # store as soon as it is generated, so a crash only loses the items in flight
+            yield i, self.output(msgs[i], answer)
+
+    @staticmethod
+    def output(msg, answer: str):
+        return [{
+            "generated_text": msg + [{"role": "assistant", "content": answer}]
+        }]
+
+    def __call__(self, msgs, do_sample=False, max_new_tokens=10):
+        yield from in_input_order(self.generate_unordered(msgs, do_sample=do_sample, max_new_tokens=max_new_tokens))
@@ -1,55 +1,29 @@
 #!/usr/bin/env python3
-import datasets
+from eval_data import load_eval_dataset
 import pandas as pd
 import itertools
 import tqdm
-from closed_models import ClosedModel, CLOSED_MODELS
+from generation import add_model_args, load_model, remove_partials
+from translation_task import LANG_NAMES, translate_unique
 
-LANG_NAMES = {
-    "ita": "Italian",
-    "pms": "Piedmontese",
-    "fra": "French",
-    "eng": "English",
-}
-
-if __name__ == "__main__":
-    import argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--model', '-m', type=str, required=True, help="Model ID")
-    parser.add_argument('--output_file', '-o', type=str, required=True, help="Output file prefix")
-    parser.add_argument('--pivot_lang', '-p', type=str, default="ita", help="Pivot language code (e.g., 'eng')") 
-    args = parser.parse_args()
-
-
-    ds = datasets.load_dataset("json", data_files={"dev": "data/pms_dev.jsonl", "devtest": "data/pms_devtest.jsonl"})
-
-    model_id = args.model
-    output_file = args.output_file
-    pivot_lang = args.pivot_lang
-
-    if model_id in CLOSED_MODELS:
-        model = ClosedModel(model_id)
-    else:
-        import transformers
-        import torch
-        model = transformers.pipeline("text-generation", model=model_id, device_map="auto", dtype=torch.bfloat16)
-    
-    def fmt(item_ds, system_prompt, user_prompt):        
-        for item in item_ds:       
-            if system_prompt is None:
-                messages = [
-                    {"role": "user", "content": user_prompt.format(item)}
-                ]                
-            else:
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt.format(item)}
-                ]
-            yield messages
+def load_direct_translations(path: str) -> dict[str, str]:
+    """Map each source sentence to its translation in a translation_task.py checkpoint."""
+    df = pd.read_json(path, lines=True)
+    translations = {}
+    for sentences, predictions in zip(df['sentence'], df['predicted']):
+        # Rows are grouped by flores id, so the fields are lists when the id has several sentences
+        if not isinstance(sentences, list):
+            sentences, predictions = [sentences], [predictions]
+        translations.update(zip(sentences, predictions))
+    return translations
 
+def run_pivot_translation(model, model_id: str, ds, output_file: str, pivot_lang: str = "ita", direct_prefix: str = None) -> list[str]:
+    """Translate both splits through the pivot language in all the directions that do not involve it.
+    Returns the partial files, see remove_partials()."""
+    partial_paths = []
     langs = list(LANG_NAMES.keys())
     langs.remove(pivot_lang)
-    for from_, to_ in tqdm.tqdm(itertools.permutations(LANG_NAMES.keys(), 2), total=len(LANG_NAMES)*(len(LANG_NAMES)-1)):
+    for from_, to_ in tqdm.tqdm(itertools.permutations(langs, 2), total=len(langs)*(len(langs)-1)):
         from_lang = LANG_NAMES[from_]
         to_lang = LANG_NAMES[to_]
 
@@ -71,20 +45,44 @@ if __name__ == "__main__":
         
         for split in ["dev", "devtest"]:
             sentences = list(ds[split][f'flores_{from_}'])
-            answers = []
-            pivots = []
             references = list(ds[split][f'flores_{to_}'])
             references = [[i] for i in references]
             splits = [split] * len(sentences)
             ids = ds[split]['flores_id']
-            for answer in model(fmt(ds[split][f'flores_{from_}'], system_prompt_to_pivot, user_prompt_to_pivot), do_sample=False, max_new_tokens=256):
-                tmp = answer[-1]['generated_text'][-1]['content'].strip()
-                pivots.append(tmp)
-            for answer in model(fmt(pivots, system_prompt_from_pivot, user_prompt_from_pivot), do_sample=False, max_new_tokens=256):
-                tmp = answer[-1]['generated_text'][-1]['content'].strip()
-                answers.append(tmp)
+            output_path = f"{output_file}.{split}.{from_}_{to_}.pivot_{pivot_lang}.jsonl"
+            partial_paths += [f"{output_path}.partial", f"{output_path}.pivot.partial"]
+            if direct_prefix is not None:
+                # The first hop is the direct translation into the pivot language
+                direct = load_direct_translations(f"{direct_prefix}.{split}.{from_}_{pivot_lang}.jsonl")
+                pivots = [direct[sentence] for sentence in sentences]
+            else:
+                pivots = translate_unique(model, sentences, system_prompt_to_pivot, user_prompt_to_pivot, max_new_tokens=256, partial_path=f"{output_path}.pivot.partial")
+            answers = translate_unique(model, pivots, system_prompt_from_pivot, user_prompt_from_pivot, max_new_tokens=256, partial_path=f"{output_path}.partial")
             df = pd.DataFrame({'split': splits, 'id': ids, 'sentence': sentences, 'reference': references, 'predicted': answers, 'pivot': pivots})
 
             if to_ == "pms":
                 df = df.groupby('id').aggregate({i: lambda x: x if i != 'reference' else list for i in df.columns})
-            df.to_json(f"{output_file}.{split}.{from_}_{to_}.pivot_{pivot_lang}.jsonl", orient='records', lines=True)
+            df.to_json(output_path, orient='records', lines=True)
+    return partial_paths
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', '-m', type=str, required=True, help="Model ID")
+    parser.add_argument('--output_file', '-o', type=str, required=True, help="Output file prefix")
+    parser.add_argument('--pivot_lang', '-p', type=str, default="ita", help="Pivot language code (e.g., 'eng')") 
+    parser.add_argument('--direct_prefix', type=str, default=None, help="Prefix of the translation_task.py checkpoints to reuse as the first hop (e.g., 'checkpoints/translation/gemma')")
+    add_model_args(parser)
+    args = parser.parse_args()
+
+
+    ds = load_eval_dataset()
+
+    model_id = args.model
+    output_file = args.output_file
+    pivot_lang = args.pivot_lang
+
+    model = load_model(model_id, args)
+
+    partial_paths = run_pivot_translation(model, model_id, ds, output_file, pivot_lang, args.direct_prefix)
+    remove_partials(partial_paths)
@@ -30,34 +30,58 @@ Use the span list file to create the ground truth alignment files and the tokeni
 # ita: original ita text
 
 import argparse
+import collections
+import heapq
 import json
 import re
 import itertools
 
 import ipdb
 
+SPECIAL_RE = re.compile(r'( ?§[0-9]+ ?)')
+PUNCT_RE = re.compile(r'[.,;:!?]')
+DASH_RE = re.compile(r'\s*-\s*')
+APOSTROPHE_RE = re.compile(r"(\w)'")
+SPACES_RE = re.compile(r'\s+')
+
 def span_argsort(span_indexes: list[tuple[int, int]]) -> list[int]:
     """Return the indices that would sort the spans by their start positions."""
     return sorted(range(len(span_indexes)), key=lambda i: span_indexes[i][1], reverse=True)
 
+def span_runs(length: int, spans_indexes: list[tuple[int, int]]) -> list[tuple[int, int, int]]:
+    """Split [0, length) into maximal (start, end, span index) runs, -1 outside the spans.
+    Where spans overlap, the last one wins."""
+    starts = collections.defaultdict(list)
+    for i, (start, end) in enumerate(spans_indexes):
+        if start < end:
+            starts[start].append((i, end))
+    boundaries = sorted({0, length} | {b for start, end in spans_indexes if start < end for b in (start, end)})
+    runs = []
+    active = [] # max-heap of (-span index, end), the spans ending before the current position are dropped lazily
+    for start, end in zip(boundaries, boundaries[1:]):
+        for i, span_end in starts.get(start, []):
+            heapq.heappush(active, (-i, span_end))
+        while active and active[0][1] <= start:
+            heapq.heappop(active)
+        owner = -active[0][0] if active else -1
+        if runs and runs[-1][2] == owner:
+            runs[-1] = (runs[-1][0], end, owner)
+        else:
+            runs.append((start, end, owner))
+    return runs
+
 def replace_tokens(text: str, span_indexes: list[tuple[int, int], tuple[int, int]], is_source: bool)-> tuple[str, list[str]]:
     """Replace spans with special tokens §0, §1, ..."""
     i = 0 if is_source else 1
     spans_indexes = [pair[i] for pair in span_indexes] # list of (start, end) tuples
-    spans = []
-    mask = [-1] * len(text)
-    for i, (start, end) in enumerate(spans_indexes): # start from the end to not mess up indexes
-        span_text = text[start:end]
-        spans.append(span_text)
-        # token = f"  §{i}  "
-        for j in range(start, end):
-            mask[j] = i
-    chars = [] # [-1, -1, 0, 0, 0, -1, -1, 1, 1, -1] -> " xx §0xx§1x"
+    spans = [text[start:end] for start, end in spans_indexes]
+    chars = [] # [(0, 2, -1), (2, 4, 0), (4, 5, -1), (5, 6, 1)] -> " xx §0 x §1 "
     last = -1
-    for i, m in enumerate(mask):
+    for start, end, m in span_runs(len(text), spans_indexes):
         if m == -1:
-            chars.append(text[i])
+            chars.append(text[start:end])
         elif m != last:
+            # As with the previous per-character mask, a span is only marked again after another span
             chars.append(f" §{m} ")
             last = m
     text = ''.join(chars)
@@ -65,8 +89,7 @@ def replace_tokens(text: str, span_indexes: list[tuple[int, int], tuple[int, int
 
 def to_parts(text: str)-> list[str]:
     """"Split the text into aligned (special tokens) and unaligned parts (strings)."""
-    regex = re.compile(r'( ?§[0-9]+ ?)')
-    parts = regex.split(text)
+    parts = SPECIAL_RE.split(text)
     parts = [part.strip() for part in parts]
     parts = [part for part in parts if part != '']
     return parts
@@ -78,15 +101,15 @@ def special_to_index(part: str)-> int:
 def tokenize(part: str) -> list[str]:
     """Preprocess the text part."""
     # remove punctuation
-    part = re.sub(r'[.,;:!?]', '', part)
+    part = PUNCT_RE.sub('', part)
     # space around -
-    part = re.sub(r'\s*-\s*', ' - ', part)
+    part = DASH_RE.sub(' - ', part)
     # lowercase
     part = part.lower()
     # space after apostrophes at the end of words
-    part = re.sub(r"(\w)'", r"\1' ", part)
+    part = APOSTROPHE_RE.sub(r"\1' ", part)
     # remove multiple spaces
-    part = re.sub(r'\s+', ' ', part)
+    part = SPACES_RE.sub(' ', part)
     part = part.strip()
 
     tokens = part.split(' ') 
@@ -141,7 +164,7 @@ def combine_tokens(parts: list[list[str]], aligned_spans: list[list[str]]) -> st
         else:
             tokens.extend(part)
     tokens = ' '.join(tokens)
-    tokens = re.sub(r'\s+', ' ', tokens)
+    tokens = SPACES_RE.sub(' ', tokens)
     return tokens.strip()
 
 def process_sample(src_text: str, trg_text: str, span_indexes: list[tuple[tuple[int, int], tuple[int, int]]]):
@@ -155,11 +178,17 @@ def process_sample(src_text: str, trg_text: str, span_indexes: list[tuple[tuple[
     trg_parts = to_parts(trg_replace)
     
 
+    # First position of each special token in the target
+    trg_positions = {}
+    for j, trg_part in enumerate(trg_parts):
+        if trg_part.startswith('§'):
+            trg_positions.setdefault(trg_part, j)
     aligned_part_indexes = [] # list of tuples with indexes of (src §#, trg §#)
     for i, src_part in enumerate(src_parts):
         if src_part.strip().startswith('§'):
-            j = trg_parts.index(src_part)
-            aligned_part_indexes.append((i,j))
+            if src_part not in trg_positions:
+                raise ValueError(f"{src_part} is not in the target parts")
+            aligned_part_indexes.append((i, trg_positions[src_part]))
     assert len(src_aligned_spans) == len(aligned_part_indexes), "Missing aligned tokens"
     
     # Clean and tokenize
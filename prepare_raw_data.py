@@ -1,16 +1,19 @@
 #!/usr/bin/env python3
+import hashlib
 import json
 import os
-import glob
 import datasets
 import collections
 import pandas as pd
 import tqdm
 import ipdb
+from submissions import FOLDERS_PATTERN, submission_folders, submission_paths, read_submissions
 
-FOLDER = "data/raw/submissions_20251118_000001/pms"
 OUT_DEV = "data/pms_dev.jsonl"
 OUT_DEVTEST = "data/pms_devtest.jsonl"
+# Per-submission records of the incremental mode, with the mtime and hash of the file they come from
+CACHE = "data/pms_submissions.cache.jsonl"
+CACHE_VERSION = 1
 
 EVAL_DICT = {  
     "Interamente corretta o quasi": 4,
@@ -32,78 +35,177 @@ def clean_text(text):
     text = text.replace("‘", "'")
     return text.strip()
 
+def build_category_index(sib_ds: pd.DataFrame) -> dict[str, list[str]]:
+    """Map each SIB-200 Italian sentence to its categories, in row order."""
+    index = collections.defaultdict(list)
+    for text, category in zip(sib_ds['text'], sib_ds['category']):
+        index[text].append(category)
+    return index
+
+def build_flores_index(flores: datasets.DatasetDict) -> dict[str, list[str]]:
+    """Split -> sentences, so that a FLORES id is a plain list lookup."""
+    return {split: flores[split]['text'] for split in flores}
+
+def submission_record(file: str, sample: dict, sib_categories: dict[str, list[str]], fra: dict[str, list[str]], eng: dict[str, list[str]]) -> dict:
+    """Fields of the submission's own row, and the review score it gives to another submission."""
+    split = sample['sample_data']['sample_split']
+    flores_id = sample['sample_data']['sample_flores_id']
+    row = {'split': split, 'flores_id': flores_id}
+    if sample['data']['valid'] and not sample['data']['empty'] and sample['sample_data']['valid']:
+        row['flores_ita'] = sample['sample_data']['sample_ita'].strip()
+        row['flores_pms'] = clean_text(sample['data']['translation'])
+
+    review = None
+    if sample['data']['valid'] and sample['review_data']['valid']:
+        evaluation = sample['data']['translation-evaluation']
+        evaluation = EVAL_DICT[evaluation]
+        evaluation_file = os.path.basename(sample['review_data']['selected_path'])
+        review = {'file': evaluation_file, 'score': evaluation}
+    if flores_id is not None:
+        categories = sib_categories.get(sample['sample_data']['sample_ita'], [])
+        if len(categories) > 1:
+            print(f"Warning: multiple SIB rows for flores_id {flores_id}")
+        if categories:
+            row['category'] = categories[0]
+        else:
+            row['category'] = UNCATEGORIZED
+        row['flores_fra'] = fra[split][flores_id]
+        row['flores_eng'] = eng[split][flores_id]
+    return {'file': file, 'row': row, 'review': review}
+
+def merge_records(records: list[dict]) -> dict[str, dict]:
+    """One row per submission file, with the review scores given by the other submissions."""
+    ds = collections.defaultdict(dict)
+    for record in records:
+        ds[record['file']].update(record['row'])
+        if record['review'] is not None:
+            review = record['review']
+            if ds[review['file']].get('review_scores') is None:
+                ds[review['file']]['review_scores'] = []
+            ds[review['file']]['review_scores'].append(review['score'])
+    return ds
+
+def pms_keys(df: pd.DataFrame, pms_column: str) -> pd.MultiIndex:
+    """(split, flores_id, cleaned translation) key of each row, used to match the corrections."""
+    return pd.MultiIndex.from_arrays([df['split'], df['flores_id'], df[pms_column].map(clean_text)])
+
+def apply_fixes(df: pd.DataFrame, fixes: pd.DataFrame) -> pd.DataFrame:
+    """Replace the translations listed in FIX (matched on their old translation) with a single join.
+    A fixed translation no longer carries the 0 review scores of the old one."""
+    # As when the fixes were applied one after the other, the first fix of a key wins:
+    # the sample no longer has the old translation when the next ones come, so they are reported as unmatched
+    fix_keys = pms_keys(fixes, 'old_flores_pms')
+    duplicated = fix_keys.duplicated(keep='first')
+    row_keys = pms_keys(df, 'flores_pms')
+    for _, row in fixes[duplicated | ~fix_keys.isin(row_keys)].iterrows():
+        print("Warning: no matching sample found for fix:", row)
+    fixes = fixes[~duplicated]
+    fix_keys = fix_keys[~duplicated]
+
+    fix_idx = fix_keys.get_indexer(row_keys)
+    fixed = fix_idx >= 0
+    df = df.copy()
+    df.loc[fixed, 'flores_pms'] = fixes['flores_pms'].map(clean_text).to_numpy()[fix_idx[fixed]]
+    df.loc[fixed, 'review_scores'] = df.loc[fixed, 'review_scores'].apply(lambda x: [score if score != 0 else 1 for score in x] if isinstance(x, list) else x)
+    return df
+
+def apply_removes(df: pd.DataFrame, removes: pd.DataFrame) -> pd.DataFrame:
+    """Drop the samples listed in REMOVE."""
+    return df[~pms_keys(df, 'flores_pms').isin(pms_keys(removes, 'flores_pms'))]
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_cache(path: str) -> dict[str, dict]:
+    cache = {}
+    if not os.path.exists(path):
+        return cache
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.pop('version', None) == CACHE_VERSION:
+                cache[entry.pop('path')] = entry
+    return cache
+
+def save_cache(path: str, cache: dict[str, dict]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for file_path, entry in cache.items():
+            f.write(json.dumps({"path": file_path, "version": CACHE_VERSION, **entry}, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+def write_if_changed(path: str, content: str):
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == content:
+                print(f"{path} unchanged")
+                return
+    with open(path, "w") as f:
+        f.write(content)
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('--input-folder', type=str, default=FOLDER)
+    parser.add_argument('--input-folder', type=str, nargs='+', default=None, help=f"Submission folders, e.g., one per collection date (default: every {FOLDERS_PATTERN} folder, oldest first)")
     parser.add_argument('--output-dev', type=str, default=OUT_DEV)
     parser.add_argument('--output-devtest', type=str, default=OUT_DEVTEST)
+    parser.add_argument('--workers', type=int, default=None, help="Processes reading the submission files (default: all cores)")
+    parser.add_argument('--incremental', action='store_true', help="Only parse the submissions that are new or changed since the last run, see --cache")
+    parser.add_argument('--cache', type=str, default=CACHE, help="Per-submission records kept between incremental runs")
     args = parser.parse_args()
 
-    if args.input_folder is not None:
-        FOLDER = args.input_folder
+    FOLDERS = args.input_folder if args.input_folder is not None else submission_folders()
     if args.output_dev is not None:
         OUT_DEV = args.output_dev
     if args.output_devtest is not None:
         OUT_DEVTEST = args.output_devtest
 
-    sib_ds = datasets.load_dataset('Davlan/sib200', 'ita_Latn') 
-    sib_train = sib_ds['train'].to_pandas()
-    sib_val = sib_ds['validation'].to_pandas()
-    sib_test = sib_ds['test'].to_pandas()
-    sib_ds = pd.concat([sib_train, sib_val, sib_test], ignore_index=True)    
+    cache = load_cache(args.cache) if args.incremental else {}
+    # A later folder overrides the files with the same name of the previous ones (e.g., a newer export of the same submission)
+    paths = {os.path.basename(path): path for folder in FOLDERS for path in submission_paths(folder, "*-*.json")}
+    paths = list(paths.values())
+    records = {}
+    to_parse = []
+    for path in paths:
+        entry = cache.get(path)
+        if entry is not None and entry['mtime'] != os.path.getmtime(path) and entry['hash'] == file_hash(path):
+            # Touched but not modified
+            entry['mtime'] = os.path.getmtime(path)
+        elif entry is None or entry['mtime'] != os.path.getmtime(path):
+            to_parse.append(path)
+            continue
+        records[path] = entry['record']
+    print(f"Submissions: {len(paths)} files, {len(to_parse)} new or changed")
 
-    fra = datasets.load_dataset("openlanguagedata/flores_plus", "fra_Latn")
-    eng = datasets.load_dataset("openlanguagedata/flores_plus", "eng_Latn")
+    if to_parse:
+        # The resources are only needed to parse new submissions
+        sib_ds = datasets.load_dataset('Davlan/sib200', 'ita_Latn') 
+        sib_train = sib_ds['train'].to_pandas()
+        sib_val = sib_ds['validation'].to_pandas()
+        sib_test = sib_ds['test'].to_pandas()
+        sib_ds = pd.concat([sib_train, sib_val, sib_test], ignore_index=True)    
+        sib_categories = build_category_index(sib_ds)
+
+        fra = build_flores_index(datasets.load_dataset("openlanguagedata/flores_plus", "fra_Latn"))
+        eng = build_flores_index(datasets.load_dataset("openlanguagedata/flores_plus", "eng_Latn"))
+
+        for filepath, sample in read_submissions(to_parse, workers=args.workers):
+            records[filepath] = submission_record(os.path.basename(filepath), sample, sib_categories, fra, eng)
+            if args.incremental:
+                # Hashing reads the file again, only worth it when the cache is saved
+                cache[filepath] = {"mtime": os.path.getmtime(filepath), "hash": file_hash(filepath), "record": records[filepath]}
+
+    if args.incremental:
+        save_cache(args.cache, {path: cache[path] for path in paths})
+    ds = merge_records([records[path] for path in paths])
 
-    ds = collections.defaultdict(dict)
-    for filepath in glob.glob(os.path.join(FOLDER, f"*-*.json")):        
-        with open(filepath, "r") as f:
-            sample = json.load(f)
-        
-        file = os.path.basename(filepath)
-        split = sample['sample_data']['sample_split']
-        ds[file]['split'] = split
-        
-        flores_id = sample['sample_data']['sample_flores_id']
-        ds[file]['flores_id'] = flores_id
-        if sample['data']['valid'] and not sample['data']['empty'] and sample['sample_data']['valid']:
-            ds[file]['flores_ita'] = sample['sample_data']['sample_ita'].strip()
-            ds[file]['flores_pms'] = clean_text(sample['data']['translation'])
-
-        if sample['data']['valid'] and sample['review_data']['valid']:
-            evaluation = sample['data']['translation-evaluation']
-            evaluation = EVAL_DICT[evaluation]
-            evaluation_file = os.path.basename(sample['review_data']['selected_path'])
-            if ds[evaluation_file].get('review_scores') is None:
-                ds[evaluation_file]['review_scores'] = []
-            ds[evaluation_file]['review_scores'].append(evaluation)
-        if flores_id is not None:
-            sib_row = sib_ds[sib_ds['text'] == sample['sample_data']['sample_ita']]
-            if len(sib_row) > 1:
-                print(f"Warning: multiple SIB rows for flores_id {flores_id}")
-            if not sib_row.empty:
-                ds[file]['category'] = sib_row.iloc[0]['category']
-            else:
-                ds[file]['category'] = UNCATEGORIZED
-            ds[file]['flores_fra'] = fra[split][flores_id]['text']
-            ds[file]['flores_eng'] = eng[split][flores_id]['text']
-    
     df = pd.DataFrame.from_records(list(ds.values()))
     df = df.dropna(subset=['flores_pms', 'split'], ignore_index=True)
     bad_samples = df[df['review_scores'].apply(lambda x: (isinstance(x, list)) and (0 in x))]
     print("Samples with review score 0:", len(bad_samples))    
     if os.path.exists(FIX):
-        fixes = pd.read_json(FIX, lines=True)
-        for _, row in fixes.iterrows():
-            mask = (df['split'] == row['split']) & \
-                (df['flores_id'] == row['flores_id']) & \
-                (clean_text(df['flores_pms']) == clean_text(row['old_flores_pms']))
-            if len(df[mask]) == 0:
-                print("Warning: no matching sample found for fix:", row)
-                continue
-            df.loc[mask, 'flores_pms'] = clean_text(row['flores_pms'])
-            df.loc[mask, 'review_scores'].apply(lambda x: x if x != 0 else 1)
+        df = apply_fixes(df, pd.read_json(FIX, lines=True))
         # Recheck bad samples
         bad_samples = df[df['review_scores'].apply(lambda x: (isinstance(x, list)) and (0 in x))]
         print("Samples with review score 0 after applying fixes (to be discated):", len(bad_samples))
@@ -111,14 +213,10 @@ if __name__ == "__main__":
         df = df[~df.index.isin(bad_samples.index)]
     
     if os.path.exists(REMOVE):
-        removes = pd.read_json(REMOVE, lines=True)
-        for _, row in removes.iterrows():
-            mask = (df['split'] == row['split']) & \
-                (df['flores_id'] == row['flores_id']) & \
-                (clean_text(df['flores_pms']) == clean_text(row['flores_pms']))
-            df = df[~mask]
+        df = apply_removes(df, pd.read_json(REMOVE, lines=True))
 
     dev = df[df['split'] == 'dev']
     devtest = df[df['split'] == 'devtest']
-    dev.to_json(OUT_DEV, orient='records', lines=True)
-    devtest.to_json(OUT_DEVTEST, orient='records', lines=True)
+    # Leave the files (and their mtime) untouched when the content is the same, so downstream targets are not rerun
+    write_if_changed(OUT_DEV, dev.to_json(orient='records', lines=True))
+    write_if_changed(OUT_DEVTEST, devtest.to_json(orient='records', lines=True))
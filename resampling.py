@@ -0,0 +1,147 @@
+import os
+import numpy as np
+
+N_BOOTSTRAP = 1000
+
+
+def bootstrap_indices(n_items: int, n_bootstrap: int = N_BOOTSTRAP) -> tuple[str, np.ndarray]:
+    """Draw the (n_bootstrap, n_items) resampling indexes exactly like sacrebleu (SACREBLEU_SEED, default 12345)."""
+    seed = os.environ.get('SACREBLEU_SEED', '12345')
+    rng = np.random.default_rng(None if seed.lower() == 'none' else int(seed))
+    return seed.lower(), rng.choice(n_items, size=(n_bootstrap, n_items), replace=True)
+
+
+def resample_counts(idxs: np.ndarray, n_items: int) -> np.ndarray:
+    """How many times each item appears in each resample, as a (n_bootstrap, n_items) matrix."""
+    n_bootstrap = len(idxs)
+    offsets = (np.arange(n_bootstrap) * n_items)[:, None]
+    return np.bincount((idxs + offsets).ravel(), minlength=n_bootstrap * n_items).reshape(n_bootstrap, n_items)
+
+
+def bleu_from_stats(metric, stats: np.ndarray) -> np.ndarray:
+    """Vectorized BLEU.compute_bleu() over rows of aggregated [sys_len, ref_len, correct..., total...] statistics.
+    Only the 'exp', 'none' and 'floor' smoothing methods without effective order, see has_from_stats()."""
+    order = metric.max_ngram_order
+    sys_len, ref_len = stats[:, 0], stats[:, 1]
+    correct, total = stats[:, 2:2 + order], stats[:, 2 + order:]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bp = np.where(sys_len < ref_len, np.exp(1 - ref_len / sys_len), 1.0)
+        bp = np.where((sys_len < ref_len) & (sys_len == 0), 0.0, bp)
+
+        # compute_bleu() stops at the first order without n-grams, the following precisions stay at 0
+        reached = np.cumprod(total > 0, axis=1).astype(bool)
+        zero = reached & (correct == 0)
+        if metric.smooth_method == 'exp':
+            # smooth_mteval doubles at every order without matches
+            smoothed = 100. / (2. ** np.cumsum(zero, axis=1) * total)
+        elif metric.smooth_method == 'floor':
+            smoothed = 100. * metric.smooth_value / total
+        else:
+            smoothed = np.zeros_like(total)
+        precisions = np.where(reached, np.where(zero, smoothed, 100. * correct / total), 0.0)
+
+        # my_log() floors log(0) to -9999999999
+        logs = np.where(precisions == 0, -9999999999, np.log(np.where(precisions == 0, 1.0, precisions)))
+    scores = bp * np.exp(logs.sum(axis=1) / order)
+    # Early stop if there are no matches
+    return np.where(correct.any(axis=1), scores, 0.0)
+
+
+def chrf_from_stats(metric, stats: np.ndarray) -> np.ndarray:
+    """Vectorized CHRF._compute_f_score() over rows of aggregated [hyp, ref, match] * order statistics."""
+    eps = 1e-16
+    factor = metric.beta ** 2
+    n_hyp, n_ref, n_match = stats[:, 0::3], stats[:, 1::3], stats[:, 2::3]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prec = np.where(n_hyp > 0, n_match / n_hyp, eps)
+        rec = np.where(n_ref > 0, n_match / n_ref, eps)
+        if metric.eps_smoothing:
+            denom = factor * prec + rec
+            score = np.where(denom > 0, (1 + factor) * prec * rec / denom, eps)
+            return 100 * score.sum(axis=1) / metric.order
+
+        effective = (n_hyp > 0) & (n_ref > 0)
+        effective_order = effective.sum(axis=1)
+        avg_prec = np.where(effective_order > 0, np.where(effective, prec, 0.0).sum(axis=1) / effective_order, 0.0)
+        avg_rec = np.where(effective_order > 0, np.where(effective, rec, 0.0).sum(axis=1) / effective_order, 0.0)
+        score = (1 + factor) * avg_prec * avg_rec / ((factor * avg_prec) + avg_rec)
+    return np.where(avg_prec + avg_rec > 0, 100 * score, 0.0)
+
+
+def ter_from_stats(metric, stats: np.ndarray) -> np.ndarray:
+    """Vectorized TER._compute_score_from_stats() over rows of aggregated [edits, ref_length] statistics."""
+    total_edits, ref_length = stats[:, 0], stats[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(ref_length > 0, total_edits / ref_length, np.where(total_edits > 0, 1.0, 0.0))
+    return 100 * score
+
+
+FROM_STATS = {
+    'BLEU': bleu_from_stats,
+    'CHRF': chrf_from_stats,
+    'TER': ter_from_stats,
+}
+
+
+def has_from_stats(metric) -> bool:
+    """Whether the metric has a vectorized implementation in FROM_STATS for its settings."""
+    name = type(metric).__name__
+    if name == 'BLEU':
+        return metric.smooth_method in ('exp', 'none', 'floor') and not metric.effective_order
+    return name in FROM_STATS
+
+
+def bootstrap_corpus_score(metric, hypotheses: list[str], references: list[list[str]], seed: str, counts: np.ndarray):
+    """Same as metric.corpus_score(..., n_bootstrap=len(counts)), with the segment statistics extracted once
+    and all the resamples (given as per-segment counts, see resample_counts()) scored with array operations.
+    Metrics without a vectorized implementation go through sacrebleu, which draws the same resamples from `seed`."""
+    if not has_from_stats(metric):
+        return metric.corpus_score(hypotheses, references, n_bootstrap=len(counts))
+    metric._check_corpus_score_args(hypotheses, references)
+    stats = metric._extract_corpus_statistics(hypotheses, references)
+    score = metric._aggregate_and_compute(stats)
+
+    bs_scores = np.sort(FROM_STATS[type(metric).__name__](metric, counts @ np.array(stats, dtype=np.float64)))
+    # Score.estimate_ci(): 95% interval, i.e. 1/40 from each side
+    lower_idx = len(bs_scores) // 40
+    upper_idx = len(bs_scores) - lower_idx - 1
+    score._ci = 0.5 * float(bs_scores[upper_idx] - bs_scores[lower_idx])
+    score._mean = float(bs_scores.mean())
+
+    # Shown in the signature
+    metric.n_bootstrap = len(counts)
+    metric.seed = seed
+    return score
+
+
+def bca_interval(theta_hat: np.ndarray, theta_hat_b: np.ndarray, theta_hat_jack: np.ndarray, confidence_level: float = 0.95) -> tuple[np.ndarray, np.ndarray]:
+    """Two-sided BCa interval as computed by scipy.stats.bootstrap(method='BCa'), for several statistics at once.
+    theta_hat: (k,) statistics on the data, theta_hat_b: (k, n_resamples) bootstrap distribution,
+    theta_hat_jack: (k, n) leave-one-out statistics."""
+    from scipy.special import ndtr, ndtri
+    theta_hat = theta_hat[:, None]
+    n_resamples = theta_hat_b.shape[-1]
+    percentile = (np.count_nonzero(theta_hat_b < theta_hat, axis=-1) + np.count_nonzero(theta_hat_b <= theta_hat, axis=-1)) / (2 * n_resamples)
+    z0_hat = ndtri(percentile)
+
+    n = float(theta_hat_jack.shape[-1])
+    u = (n - 1) * (theta_hat_jack.mean(axis=-1, keepdims=True) - theta_hat_jack)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a_hat = 1/6 * (np.sum(u**3, axis=-1) / n**3) / (np.sum(u**2, axis=-1) / n**2)**(3/2)
+
+        z_alpha = float(ndtri((1 - confidence_level) / 2))
+        num1 = z0_hat + z_alpha
+        alpha_1 = ndtr(z0_hat + num1 / (1 - a_hat * num1))
+        num2 = z0_hat - z_alpha
+        alpha_2 = ndtr(z0_hat + num2 / (1 - a_hat * num2))
+
+    ci_low = np.full(len(theta_hat_b), np.nan)
+    ci_high = np.full(len(theta_hat_b), np.nan)
+    for k, distribution in enumerate(theta_hat_b):
+        if not np.isnan(alpha_1[k]):
+            ci_low[k] = np.quantile(distribution, alpha_1[k])
+        if not np.isnan(alpha_2[k]):
+            ci_high[k] = np.quantile(distribution, alpha_2[k])
+    return ci_low, ci_high
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Load a model once and run classification, direct translation and pivot translation with it.
+Writes the same checkpoint files as classification_task.py, translation_task.py and pivot_translation_task.py.
+"""
+from eval_data import load_eval_dataset
+from generation import add_model_args, load_model, remove_partials
+from classification_task import run_classification
+from translation_task import run_translation
+from pivot_translation_task import run_pivot_translation
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', '-m', type=str, required=True, help="Model ID")
+    parser.add_argument('--classification_output', type=str, required=True, help="Classification output file prefix")
+    parser.add_argument('--translation_output', type=str, required=True, help="Translation output file prefix (direct and pivot)")
+    parser.add_argument('--langs', type=str, nargs='+', default=['ita', 'pms', 'fra', 'eng'], help="Languages to classify")
+    parser.add_argument('--pivot_lang', '-p', type=str, default="ita", help="Pivot language code")
+    parser.add_argument('--scoring', type=str, choices=['generate', 'loglik'], default='generate', help="Classification mode, see classification_task.py")
+    add_model_args(parser)
+    args = parser.parse_args()
+
+    ds = load_eval_dataset()
+
+    model = load_model(args.model, args)
+
+    partial_paths = []
+    for lang in args.langs:
+        partial_paths += run_classification(model, ds, lang, args.classification_output, args.scoring)
+    partial_paths += run_translation(model, args.model, ds, args.translation_output)
+    # The direct translations into the pivot language have just been written, reuse them as the first hop
+    partial_paths += run_pivot_translation(model, args.model, ds, args.translation_output, args.pivot_lang, direct_prefix=args.translation_output)
+
+    remove_partials(partial_paths)
@@ -1,27 +1,156 @@
 #!/usr/bin/env python3
 from simalign import SentenceAligner
 import argparse
+import hashlib
+import json
+import os
+import numpy as np
+from alignment_score import score_file
 
 # From simalign
 METHODS = {"a": "inter", "m": "mwmf", "i": "itermax", "f": "fwd", "r": "rev"}
 
+
+class EmbeddingCache:
+    """Subword embeddings of a list of sentences, stored as one .npy array (memory-mapped when read) plus sentence offsets.
+    The entries are keyed by model, layer and sentences, so changing the matching method reuses them."""
+    def __init__(self, directory: str, model: str, layer: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.model = model
+        self.layer = layer
+
+    def path(self, sentences: list[list[str]]) -> str:
+        payload = json.dumps([self.model, self.layer, sentences], ensure_ascii=False)
+        return os.path.join(self.directory, hashlib.sha256(payload.encode("utf-8")).hexdigest())
+
+    def get(self, sentences: list[list[str]]) -> list[np.ndarray] | None:
+        path = self.path(sentences)
+        if not os.path.exists(path + ".offsets.npy"):
+            return None
+        vectors = np.load(path + ".npy", mmap_mode='r')
+        offsets = np.load(path + ".offsets.npy")
+        return [vectors[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def put(self, sentences: list[list[str]], vectors: list[np.ndarray]):
+        path = self.path(sentences)
+        offsets = np.cumsum([0] + [len(v) for v in vectors])
+        # The offsets are written last, so an interrupted write is never read back
+        for suffix, array in [(".npy", np.concatenate(vectors)), (".offsets.npy", offsets)]:
+            with open(path + suffix + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + suffix + ".tmp", path + suffix)
+
+
+def word_subwords(aligner: SentenceAligner, sentences: list[list[str]]) -> list[list[list[str]]]:
+    """Subwords of each word, as tokenized by SentenceAligner.get_word_aligns()."""
+    return [[aligner.embed_loader.tokenizer.tokenize(word) for word in words] for words in sentences]
+
+
+def embed_sentences(aligner: SentenceAligner, sentences: list[list[str]], subwords: list[list[list[str]]], batch_size: int = 32) -> list[np.ndarray]:
+    """Subword embeddings of each sentence, computed on batches of sentences of similar length."""
+    lengths = [sum(len(word) for word in words) for words in subwords]
+    order = sorted(range(len(sentences)), key=lambda i: lengths[i])
+    vectors = [None] * len(sentences)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        embeddings = aligner.embed_loader.get_embed_list([sentences[i] for i in batch]).cpu().detach().numpy()
+        for row, i in enumerate(batch):
+            vectors[i] = embeddings[row, :lengths[i]]
+    return vectors
+
+
+def cached_embeddings(aligner: SentenceAligner, sentences: list[list[str]], subwords: list[list[list[str]]], batch_size: int = 32, cache: EmbeddingCache = None) -> list[np.ndarray]:
+    vectors = cache.get(sentences) if cache is not None else None
+    if vectors is None:
+        vectors = embed_sentences(aligner, sentences, subwords, batch_size)
+        if cache is not None:
+            cache.put(sentences, vectors)
+    return vectors
+
+
+def align_from_vectors(aligner: SentenceAligner, src_subwords: list[list[str]], trg_subwords: list[list[str]], src_vectors: np.ndarray, trg_vectors: np.ndarray) -> dict[str, list[tuple[int, int]]]:
+    """The matching step of SentenceAligner.get_word_aligns(), on precomputed subword embeddings."""
+    vectors = [np.asarray(src_vectors), np.asarray(trg_vectors)]
+    if aligner.token_type == "word":
+        vectors = aligner.average_embeds_over_words(vectors, [src_subwords, trg_subwords])
+
+    sim = aligner.get_similarity(vectors[0], vectors[1])
+    sim = aligner.apply_distortion(sim, aligner.distortion)
+    all_mats = {}
+    all_mats["fwd"], all_mats["rev"] = aligner.get_alignment_matrix(sim)
+    all_mats["inter"] = all_mats["fwd"] * all_mats["rev"]
+    if "mwmf" in aligner.matching_methods:
+        all_mats["mwmf"] = aligner.get_max_weight_match(sim)
+    if "itermax" in aligner.matching_methods:
+        all_mats["itermax"] = aligner.iter_max(sim)
+
+    if aligner.token_type == "bpe":
+        src_map = [i for i, word in enumerate(src_subwords) for _ in word]
+        trg_map = [j for j, word in enumerate(trg_subwords) for _ in word]
+    else:
+        src_map = list(range(len(vectors[0])))
+        trg_map = list(range(len(vectors[1])))
+    aligns = {}
+    for ext in aligner.matching_methods:
+        rows, cols = np.nonzero(all_mats[ext] > 0)
+        aligns[ext] = sorted({(src_map[i], trg_map[j]) for i, j in zip(rows, cols)})
+    return aligns
+
+
+def write_alignments(path: str, alignments: list[list[tuple[int, int]]]):
+    with open(path, 'w') as out:
+        for alignment in alignments:
+            alignments_str = ' '.join([f"{src_idx}-{tgt_idx}" for src_idx, tgt_idx in alignment])
+            out.write(alignments_str + '\n')
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('source', type=str, help="Source language file")
     parser.add_argument('target', type=str, help="Target language file")
-    parser.add_argument('output', type=str, help="Output alignment file")
+    parser.add_argument('output', type=str, nargs='?', default=None, help="Output alignment file of the first method")
     parser.add_argument('--device', type=str, default='cuda', help="Device to use (e.g., 'cpu' or 'cuda')")
-    parser.add_argument('--model', type=str, default='xlmr', help="Model to use for alignment") 
-    parser.add_argument('--method', type=str, default='i')
+    parser.add_argument('--model', type=str, default='xlmr', help="Model to use for alignment")
+    parser.add_argument('--method', type=str, default='i', help=f"One or more matching methods, all computed from the same similarity matrices: {METHODS}")
+    parser.add_argument('--output_prefix', type=str, default=None, help="Write one {prefix}.{method name}.align file per method")
+    parser.add_argument('--gold', type=str, default=None, help="Gold alignments, score each {prefix}.{method name}.align file with alignment_score.py")
+    parser.add_argument('--layer', type=int, default=8, help="Hidden layer used as embeddings")
+    parser.add_argument('--batch_size', type=int, default=32, help="Sentences embedded per forward pass")
+    parser.add_argument('--embedding_cache', type=str, default=None, help="Directory caching the subword embeddings across runs")
+    parser.add_argument('--threads', type=int, default=None, help="CPU threads used by torch")
 
     args = parser.parse_args()
-    if args.method not in METHODS.keys():
-        raise ValueError(f"Unknown method {args.method}, choose from {list(METHODS.keys())}")
-    
-    aligner = SentenceAligner(model=args.model, device=args.device, matching_methods=args.method)
-    with open(args.source) as src, open(args.target) as tgt, open(args.output, 'w') as out:
-        for src_line, tgt_line in zip(src, tgt):
-            alignments = aligner.get_word_aligns(src_line, tgt_line)[METHODS[args.method]]
-            alignments_str = ' '.join([f"{src_idx}-{tgt_idx}" for src_idx, tgt_idx in alignments])
-            out.write(alignments_str + '\n')
-    
+    for method in args.method:
+        if method not in METHODS.keys():
+            raise ValueError(f"Unknown method {method}, choose from {list(METHODS.keys())}")
+    if args.output is None and args.output_prefix is None:
+        parser.error("an output file or --output_prefix is required")
+    if args.gold is not None and args.output_prefix is None:
+        parser.error("--gold scores the --output_prefix files")
+    if args.threads is not None:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    aligner = SentenceAligner(model=args.model, device=args.device, matching_methods=args.method, layer=args.layer)
+    cache = EmbeddingCache(args.embedding_cache, aligner.model, args.layer) if args.embedding_cache is not None else None
+    with open(args.source) as src, open(args.target) as tgt:
+        pairs = [(src_line.split(), tgt_line.split()) for src_line, tgt_line in zip(src, tgt)]
+    src_sents = [src_words for src_words, _ in pairs]
+    trg_sents = [trg_words for _, trg_words in pairs]
+    src_subwords = word_subwords(aligner, src_sents)
+    trg_subwords = word_subwords(aligner, trg_sents)
+    src_vectors = cached_embeddings(aligner, src_sents, src_subwords, args.batch_size, cache)
+    trg_vectors = cached_embeddings(aligner, trg_sents, trg_subwords, args.batch_size, cache)
+
+    # Every method comes from the same similarity matrix of each pair
+    aligns = [align_from_vectors(aligner, src_subwords[i], trg_subwords[i], src_vectors[i], trg_vectors[i]) for i in range(len(pairs))]
+    if args.output is not None:
+        write_alignments(args.output, [align[METHODS[args.method[0]]] for align in aligns])
+    if args.output_prefix is not None:
+        for method in args.method:
+            name = METHODS[method]
+            write_alignments(f"{args.output_prefix}.{name}.align", [align[name] for align in aligns])
+            if args.gold is not None:
+                print(name, end=": ")
+                score_file(args.gold, f"{args.output_prefix}.{name}.align", f"{args.output_prefix}.{name}.scores")
@@ -1,5 +1,5 @@
 import sentencepiece as spm
-import datasets
+from eval_data import load_split
 import itertools
 import json
 
@@ -8,18 +8,8 @@ def parity_score(l1: list[int], l2: list[int]) -> float:
     scores = [i / j if j > 0 else 0 for i, j in zip(l1, l2)]
     return sum(scores) / len(scores)
 
-if __name__ == "__main__":
-    import argparse
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--model", "-m", type=str, required=True)
-    parser.add_argument("--input", "-i", type=str, nargs="+", required=True)
-    parser.add_argument("--output", "-o", type=str, required=True)
-    args = parser.parse_args()
-
-    tokenizer = spm.SentencePieceProcessor(model_file=args.model)
-    ds = datasets.load_dataset("json", data_files=args.input)["train"]
-
+def sp_parity_scores(tokenizer: spm.SentencePieceProcessor, ds) -> dict:
+    """Average lengths and pairwise parity of the FLORES sentences of the four languages."""
     pms_lengths = tokenizer.encode_as_pieces(list(ds['flores_pms']))
     ita_lengths = tokenizer.encode_as_pieces(list(ds['flores_ita']))
     fra_lengths = tokenizer.encode_as_pieces(list(ds['flores_fra']))
@@ -45,6 +35,21 @@ if __name__ == "__main__":
         2,
     ):
         scores[f"parity_{lang1}_vs_{lang2}"] = parity_score(len1, len2)
+    return scores
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", "-m", type=str, required=True)
+    parser.add_argument("--input", "-i", type=str, nargs="+", required=True)
+    parser.add_argument("--output", "-o", type=str, required=True)
+    args = parser.parse_args()
+
+    tokenizer = spm.SentencePieceProcessor(model_file=args.model)
+    ds = load_split(args.input)
+
+    scores = sp_parity_scores(tokenizer, ds)
 
     with open(args.output, "w") as f:
         json.dump(scores, f, indent=2)
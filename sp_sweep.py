@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import os
+import pandas as pd
+import sentencepiece as spm
+from concurrent.futures import ProcessPoolExecutor
+from eval_data import EVAL_FILES, load_split
+from sp_parity import sp_parity_scores
+from train_sp import train_model
+
+MODEL_TYPES = ["unigram", "bpe"]
+VOCAB_SIZES = [8000, 16000, 32000, 64000]
+
+
+def sweep_job(corpus: str, model_dir: str, model_type: str, vocab: int, input_sentence_size: int, num_threads: int, eval_files: dict[str, str]) -> list[dict]:
+    """Train one configuration and evaluate its parity on every split and on all the splits together."""
+    model_prefix = os.path.join(model_dir, f"sentencepiece.{vocab}.{model_type}")
+    train_model(corpus, model_prefix, vocab, model_type, input_sentence_size, num_threads)
+    tokenizer = spm.SentencePieceProcessor(model_file=model_prefix + ".model")
+
+    splits = dict(eval_files)
+    splits["all"] = list(eval_files.values())
+    return [
+        {"model_type": model_type, "vocab_size": vocab, "split": split, **sp_parity_scores(tokenizer, load_split(paths))}
+        for split, paths in splits.items()
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Train a grid of SentencePiece models in parallel and evaluate their parity.")
+    parser.add_argument('corpus', type=str, help="Manifest of the corpus snapshot written by corpus_snapshot.py")
+    parser.add_argument('output', type=str, help="CSV file with the parity scores of every model and split")
+    parser.add_argument('--model_dir', type=str, default="checkpoints/sp_sweep")
+    parser.add_argument('--model_types', type=str, nargs='+', default=MODEL_TYPES)
+    parser.add_argument('--vocab_sizes', type=int, nargs='+', default=VOCAB_SIZES)
+    parser.add_argument('--input_sentence_size', type=int, default=0, help="Sentences sampled from the snapshot (0 for all)")
+    parser.add_argument('--workers', type=int, default=None, help="Models trained at the same time (all the configurations by default)")
+    parser.add_argument('--threads', type=int, default=None, help="SentencePiece threads of each model (the cores split among the workers by default)")
+    args = parser.parse_args()
+
+    grid = [(model_type, vocab) for model_type in args.model_types for vocab in args.vocab_sizes]
+    workers = min(args.workers or len(grid), len(grid))
+    threads = args.threads or max(1, (len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1) // workers)
+    os.makedirs(args.model_dir, exist_ok=True)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = [
+            executor.submit(sweep_job, args.corpus, args.model_dir, model_type, vocab, args.input_sentence_size, threads, EVAL_FILES)
+            for model_type, vocab in grid
+        ]
+        for job in jobs:
+            rows += job.result()
+
+    pd.DataFrame(rows).to_csv(args.output, index=False)
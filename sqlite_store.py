@@ -0,0 +1,27 @@
+import os
+import sqlite3
+
+
+class SQLiteStore:
+    """Key-value table in an SQLite file, shared by concurrent jobs."""
+    def __init__(self, path: str, table: str, value_column: str, value_type: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.table = table
+        self.value_column = value_column
+        # Several Snakemake jobs can share the same file, wait for the lock instead of failing
+        self.conn = sqlite3.connect(path, timeout=600)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, {value_column} {value_type} NOT NULL)")
+        self.conn.commit()
+
+    def get(self, key: str):
+        row = self.conn.execute(f"SELECT {self.value_column} FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def put_items(self, items: list[tuple[str, object]]):
+        """Store several (key, value) pairs in one transaction."""
+        self.conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, {self.value_column}) VALUES (?, ?)", items)
+        self.conn.commit()
+
+    def put(self, key: str, value):
+        self.put_items([(key, value)])
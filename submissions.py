@@ -0,0 +1,48 @@
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+FOLDER = "data/raw/submissions_20251118_000001/pms"
+# One folder per export, named after its date
+FOLDERS_PATTERN = "data/raw/submissions_*/pms"
+REQUIRED_KEYS = ["data", "sample_data", "review_data"]
+
+
+def read_submission(path: str) -> dict:
+    """Load a submission file and check that it has the sections every consumer reads."""
+    try:
+        with open(path, "r") as f:
+            sample = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Submission {path} is not valid JSON: {e}") from e
+    missing = [key for key in REQUIRED_KEYS if not isinstance(sample.get(key), dict)]
+    if missing:
+        raise ValueError(f"Submission {path} has no {', '.join(missing)} section")
+    return sample
+
+
+def submission_paths(folder: str = FOLDER, pattern: str = "*.json") -> list[str]:
+    return sorted(glob.glob(os.path.join(folder, pattern)))
+
+
+def submission_folders(pattern: str = FOLDERS_PATTERN) -> list[str]:
+    """The export folders matching `pattern`, oldest first (the dates in the names sort chronologically)."""
+    return sorted(path for path in glob.glob(pattern) if os.path.isdir(path))
+
+
+def read_submissions(paths: list[str], workers: int = None, chunksize: int = 64):
+    """Yield (path, submission) for every path, in order.
+    The files are parsed by a pool of `workers` processes (all the cores by default, 1 to read them in this process)."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(paths) <= chunksize:
+        for path in paths:
+            yield path, read_submission(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from zip(paths, executor.map(read_submission, paths, chunksize=chunksize))
+
+
+def iter_submissions(folder: str = FOLDER, pattern: str = "*.json", workers: int = None, chunksize: int = 64):
+    """Yield (path, submission) for every file of the folder matching `pattern`, in sorted path order."""
+    yield from read_submissions(submission_paths(folder, pattern), workers, chunksize)
@@ -0,0 +1,64 @@
+import random
+import pytest
+from alignment_eval import SCORES, score_systems
+from alignment_score import load_gold, calc_score
+
+
+def write_links(path, lines):
+    with open(path, "w") as f:
+        f.writelines(" ".join(links) + "\n" for links in lines)
+
+
+def random_links(rng: random.Random, n_sentences: int, gold: bool = False, probabilities: bool = False, min_links: int = 0):
+    lines = []
+    for _ in range(n_sentences):
+        links = []
+        for _ in range(rng.randint(min_links, 12)):
+            i, j = rng.randint(0, 15), rng.randint(0, 15)
+            if gold:
+                links.append(f"{i}{'p' if rng.random() < 0.3 else '-'}{j}")
+            elif probabilities:
+                links.append(f"{i}-{j}-{rng.random():.2f}")
+            else:
+                links.append(f"{i}-{j}")
+        lines.append(links)
+    return lines
+
+
+def expected_scores(gold_path, system_path) -> dict:
+    return dict(zip(SCORES, calc_score(system_path, *load_gold(gold_path))))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_calc_score(tmp_path, seed):
+    rng = random.Random(seed)
+    n_sentences = rng.randint(1, 200)
+    gold = tmp_path / "gold.align"
+    write_links(gold, random_links(rng, n_sentences, gold=True))
+    # calc_score() fails on empty system lines, hence at least one link per sentence
+    systems = [tmp_path / "plain.align", tmp_path / "probabilities.align", tmp_path / "short.align"]
+    write_links(systems[0], random_links(rng, n_sentences, min_links=1))
+    write_links(systems[1], random_links(rng, n_sentences, probabilities=True, min_links=1))
+    write_links(systems[2], random_links(rng, max(1, n_sentences - 5), min_links=1))
+
+    results = score_systems(str(gold), [str(path) for path in systems], num_resamples=50)
+    for path in systems:
+        assert {name: results[str(path)][name] for name in SCORES} == expected_scores(gold, path)
+
+
+def test_only_possible_gold_links(tmp_path):
+    gold = tmp_path / "gold.align"
+    system = tmp_path / "system.align"
+    write_links(gold, [["0p0", "1p1"], ["2p0"]])
+    write_links(system, [["0-0"], ["1-1"]])
+    results = score_systems(str(gold), [str(system)], num_resamples=50)
+    assert {name: results[str(system)][name] for name in SCORES} == expected_scores(gold, system)
+
+
+def test_system_without_links(tmp_path):
+    gold = tmp_path / "gold.align"
+    system = tmp_path / "system.align"
+    write_links(gold, [["0-0", "1p1"], ["2-0"]])
+    write_links(system, [[], []])
+    results = score_systems(str(gold), [str(system)], num_resamples=50)
+    assert {name: results[str(system)][name] for name in SCORES} == {"Precision": 0.0, "Recall": 0.0, "F1": 0.0, "AER": 1.0}
@@ -0,0 +1,55 @@
+import json
+import random
+import pytest
+import sacrebleu
+from resampling import N_BOOTSTRAP, bootstrap_indices, resample_counts, bootstrap_corpus_score
+
+WORDS = "il gat a mangia la soupa ëd cà bin mal the cat eats soup , . !".split()
+
+
+def random_corpus(n_segments: int, n_refs: int, seed: int) -> tuple[list[str], list[list[str]]]:
+    rng = random.Random(seed)
+    sentence = lambda: " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+    hypotheses = [sentence() for _ in range(n_segments)]
+    references = [[sentence() for _ in range(n_segments)] for _ in range(n_refs)]
+    return hypotheses, references
+
+
+def metrics():
+    # The metrics of translation_score.sacrebleu_scores(), then settings without a vectorized implementation
+    return [
+        sacrebleu.BLEU(lowercase=True),
+        sacrebleu.CHRF(lowercase=True, word_order=2),
+        sacrebleu.TER(case_sensitive=False, no_punct=True, normalized=True),
+        sacrebleu.BLEU(smooth_method='add-k'),
+        sacrebleu.BLEU(effective_order=True),
+    ]
+
+
+def formatted(metric, score) -> dict:
+    return json.loads(score.format(signature=metric.get_signature().format(), is_json=True))
+
+
+@pytest.mark.parametrize("n_segments,n_refs,seed", [(1, 1, 0), (20, 1, 1), (50, 2, 2), (120, 3, 3)])
+@pytest.mark.parametrize("k", range(len(metrics())))
+def test_bootstrap_corpus_score_matches_sacrebleu(n_segments, n_refs, seed, k):
+    hypotheses, references = random_corpus(n_segments, n_refs, seed)
+    bs_seed, idxs = bootstrap_indices(n_segments, N_BOOTSTRAP)
+    metric = metrics()[k]
+    score = bootstrap_corpus_score(metric, hypotheses, references, bs_seed, resample_counts(idxs, n_segments))
+
+    expected_metric = metrics()[k]
+    expected = expected_metric.corpus_score(hypotheses, references, n_bootstrap=N_BOOTSTRAP)
+    assert formatted(metric, score) == pytest.approx(formatted(expected_metric, expected))
+    # Unrounded, the bootstrap statistics differ a little: sacrebleu sums the resampled statistics in float32
+    assert score._ci == pytest.approx(expected._ci, rel=1e-5)
+    assert score._mean == pytest.approx(expected._mean, rel=1e-5)
+
+
+def test_sacrebleu_scores_matches_sacrebleu():
+    translation_score = pytest.importorskip("translation_score")
+    hypotheses, references = random_corpus(80, 2, 4)
+    scores = translation_score.sacrebleu_scores(hypotheses, references)
+    for name, metric in zip(["bleu", "chrf++", "ter"], metrics()):
+        expected = metric.corpus_score(hypotheses, references, n_bootstrap=N_BOOTSTRAP)
+        assert scores[name] == pytest.approx(formatted(metric, expected))
@@ -1,35 +1,35 @@
-import datasets
 import sentencepiece as spm
-import random
+from corpus_snapshot import shard_paths, iter_snapshot
+
+def train_model(corpus: str, model_prefix: str, vocab: int, model_type: str, input_sentence_size: int = 0, num_threads: int = 16):
+    """Train a SentencePiece model on the corpus snapshot whose manifest is `corpus`."""
+    manifest, paths = shard_paths(corpus)
+    # input_sentence_size samples the sentences, with the seed of the snapshot
+    spm.set_random_generator_seed(manifest["config"]["seed"])
+    if manifest["config"]["compress"]:
+        # SentencePiece only reads plain text files, the gzipped shards are streamed instead
+        data = {"sentence_iterator": iter_snapshot(corpus)}
+    else:
+        data = {"input": paths}
+    spm.SentencePieceTrainer.train(
+        **data,
+        num_threads=num_threads, # SentencePiece default
+        model_prefix=model_prefix, 
+        vocab_size=vocab,
+        model_type=model_type,
+        input_sentence_size=input_sentence_size,
+        shuffle_input_sentence=True,
+        byte_fallback=True
+    )
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('model', type=str)
     parser.add_argument('vocab', type=int)
-    parser.add_argument('samples', type=int)
+    parser.add_argument('corpus', type=str, help="Manifest of the corpus snapshot written by corpus_snapshot.py")
+    parser.add_argument('--input_sentence_size', type=int, default=0, help="Sentences sampled from the snapshot (0 for all)")
     args = parser.parse_args()  
 
-    samples = []
-
-    for lang in ['pms_Latn', "ita_Latn", "fra_Latn", "eng_Latn"]:           
-        ds = datasets.load_dataset("cis-lmu/Glot500", lang, split="train", streaming=True)
-        samples += [sample['text'] for _, sample in zip(range(args.samples), ds)]
-    
-    rng = random.Random(42)
-    rng.shuffle(samples)
-
-    spm.SentencePieceTrainer.train(
-        sentence_iterator=iter(samples), 
-        model_prefix=f"{args.model}.unigram", 
-        vocab_size=args.vocab,
-        model_type='unigram',
-        byte_fallback=True
-    )
-    spm.SentencePieceTrainer.train(
-        sentence_iterator=iter(samples), 
-        model_prefix=f"{args.model}.bpe", 
-        vocab_size=args.vocab,
-        model_type='bpe',
-        byte_fallback=True
-    )
+    for model_type in ['unigram', 'bpe']:
+        train_model(args.corpus, f"{args.model}.{model_type}", args.vocab, model_type, args.input_sentence_size)
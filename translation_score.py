@@ -1,28 +1,26 @@
 #!/usr/bin/env python3
-import evaluate
 import json
 import ipdb
 import pandas as pd
 import sacrebleu
 import numpy as np
 from scipy.stats import bootstrap
+from importlib.metadata import version, PackageNotFoundError
+from comet_cache import CometCache
+from resampling import N_BOOTSTRAP, bootstrap_indices, resample_counts, bootstrap_corpus_score
 
+COMET_MODEL = "Unbabel/wmt22-comet-da" # checkpoint of evaluate.load('comet')
 
-if __name__ == "__main__":
-    import argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--input', '-i', type=str, required=True, nargs='+', help="Input file prefix")
-    parser.add_argument('--output', '-o', type=str, required=True, help="Output score file")
-    args = parser.parse_args()    
-
-    df = pd.concat([pd.read_json(f, lines=True) for f in args.input])
-    max_refs = max(len(refs) if isinstance(refs, list) else 1 for refs in df["reference"]) 
+def load_segments(files: list[str]):
+    """Read the translation checkpoints and flatten them for sacrebleu (multi-reference) and COMET (one row per reference)."""
+    df = pd.concat([pd.read_json(f, lines=True) for f in files])
+    max_refs = max(len(refs) if isinstance(refs, list) else 1 for refs in df["reference"])
     flat_preds = []
     flat_refs = []
     flat_sources = []
-    all_refs = [[] for _ in range(max_refs)]  
-    all_preds = []  
-    
+    all_refs = [[] for _ in range(max_refs)]
+    all_preds = []
+
     for item in df.iloc:
         pred = item['predicted']
         refs = item['reference']
@@ -51,28 +49,99 @@ if __name__ == "__main__":
                     flat_preds.append(p)
                     flat_refs.append(refs[i])
                     flat_sources.append(source)
+    return all_preds, all_refs, flat_preds, flat_refs, flat_sources
+
+def sacrebleu_scores(all_preds: list[str], all_refs: list[list[str]]) -> dict:
+    """BLEU, chrF++ and TER with 1000 bootstrap resamples, the same resamples being shared by the three metrics."""
     scores = {}
     bleu = sacrebleu.BLEU(lowercase=True)
     chrf = sacrebleu.CHRF(lowercase=True, word_order=2)
     ter = sacrebleu.TER(case_sensitive=False, no_punct=True, normalized=True)
-    
-    bleu_scores = bleu.corpus_score(hypotheses=all_preds, references=all_refs, n_bootstrap=1000)
-    chrf_scores = chrf.corpus_score(hypotheses=all_preds, references=all_refs, n_bootstrap=1000)
-    ter_scores = ter.corpus_score(hypotheses=all_preds, references=all_refs, n_bootstrap=1000)
-    bleu_sign = bleu.get_signature().format()
-    chrf_sign = chrf.get_signature().format()
-    ter_sign = ter.get_signature().format()
-
-    scores['bleu'] = json.loads(bleu_scores.format(signature=bleu_sign, is_json=True))
-    scores['chrf++'] = json.loads(chrf_scores.format(signature=chrf_sign, is_json=True))
-    scores['ter'] = json.loads(ter_scores.format(signature=ter_sign, is_json=True))
-    comet = evaluate.load('comet')
-    comet_scores = comet.compute(predictions=flat_preds, references=flat_refs, sources=flat_sources)
-    scores['comet'] = {"score": comet_scores['mean_score']}
-    bs = bootstrap(data=(comet_scores['scores'],), statistic=np.mean, vectorized=True, rng=42, n_resamples=1000)
+
+    seed, idxs = bootstrap_indices(len(all_preds), N_BOOTSTRAP)
+    counts = resample_counts(idxs, len(all_preds))
+    for name, metric in [('bleu', bleu), ('chrf++', chrf), ('ter', ter)]:
+        score = bootstrap_corpus_score(metric, all_preds, all_refs, seed, counts)
+        scores[name] = json.loads(score.format(signature=metric.get_signature().format(), is_json=True))
+    return scores
+
+def comet_segment_scores(comet, sources: list[str], predictions: list[str], references: list[str], batch_size: int = 16) -> list[float]:
+    """Same as comet.compute(), but with a configurable batch size."""
+    import torch
+    data = [{"src": s, "mt": p, "ref": r} for s, p, r in zip(sources, predictions, references)]
+    gpus = 1 if torch.cuda.is_available() else 0
+    return list(comet.scorer.predict(data, batch_size=batch_size, gpus=gpus, progress_bar=False).scores)
+
+def comet_version() -> str:
+    try:
+        return f"{COMET_MODEL}|unbabel-comet=={version('unbabel-comet')}"
+    except PackageNotFoundError:
+        return COMET_MODEL
+
+def cached_comet_scores(sources: list[str], predictions: list[str], references: list[str], cache: CometCache = None, batch_size: int = 16) -> list[float]:
+    """Segment-level COMET scores, only the segments missing from the cache go through the model (loaded only if needed)."""
+    triplets = list(zip(sources, predictions, references))
+    scores = cache.get_many(list(dict.fromkeys(triplets))) if cache is not None else {}
+    misses = list(dict.fromkeys(triplet for triplet in triplets if triplet not in scores))
+    print(f"COMET: {len(triplets) - len(misses)} cached segments, {len(misses)} to score")
+    if misses:
+        # Only loaded when there is something to score: the jobs with a warm cache skip the whole evaluate/COMET stack
+        import evaluate
+        comet = evaluate.load('comet')
+        miss_scores = dict(zip(misses, comet_segment_scores(comet, *zip(*misses), batch_size=batch_size)))
+        if cache is not None:
+            cache.put_many(miss_scores)
+        scores.update(miss_scores)
+    return [scores[triplet] for triplet in triplets]
+
+def comet_summary(segment_scores: list[float]) -> dict:
+    scores = {"score": float(np.mean(segment_scores))}
+    bs = bootstrap(data=(segment_scores,), statistic=np.mean, vectorized=True, rng=42, n_resamples=1000)
     std = bs.standard_error
     ci_low, ci_high = bs.confidence_interval
-    scores['comet'].update({"std": std, "ci_low": ci_low, "ci_high": ci_high})
+    scores.update({"std": std, "ci_low": ci_low, "ci_high": ci_high})
+    return scores
+
+def score_manifest(manifest: str, batch_size: int, cache: CometCache = None):
+    """Score every (input files, output file) pair of the manifest, scoring all the COMET segments together."""
+    with open(manifest) as f:
+        jobs = [json.loads(line) for line in f if line.strip()]
+    segments = [load_segments(job['input']) for job in jobs]
+
+    # Joint (dev+devtest) jobs repeat the segments of the per-split jobs, cached_comet_scores() scores each triplet once
+    triplets = [
+        triplet for _, _, flat_preds, flat_refs, flat_sources in segments
+        for triplet in zip(flat_sources, flat_preds, flat_refs)
+    ]
+    print(f"Scoring {len(jobs)} files")
+    triplet_scores = dict(zip(triplets, cached_comet_scores(*zip(*triplets), cache=cache, batch_size=batch_size)))
+
+    for job, (all_preds, all_refs, flat_preds, flat_refs, flat_sources) in zip(jobs, segments):
+        scores = sacrebleu_scores(all_preds, all_refs)
+        scores['comet'] = comet_summary([triplet_scores[triplet] for triplet in zip(flat_sources, flat_preds, flat_refs)])
+        with open(job['output'], "w") as f:
+            json.dump(scores, f, indent=2)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', '-i', type=str, nargs='+', help="Input file prefix")
+    parser.add_argument('--output', '-o', type=str, help="Output score file")
+    parser.add_argument('--manifest', type=str, default=None, help="JSONL file with one {\"input\": [...], \"output\": ...} job per line, scored in a single run")
+    parser.add_argument('--batch_size', type=int, default=16, help="COMET batch size")
+    parser.add_argument('--comet_cache', type=str, default=None, help="SQLite file with the segment-level COMET scores")
+    args = parser.parse_args()
+
+    cache = CometCache(args.comet_cache, comet_version()) if args.comet_cache is not None else None
+    if args.manifest is not None:
+        score_manifest(args.manifest, args.batch_size, cache)
+        exit()
+    if args.input is None or args.output is None:
+        parser.error("--input and --output are required without --manifest")
+
+    all_preds, all_refs, flat_preds, flat_refs, flat_sources = load_segments(args.input)
+    scores = sacrebleu_scores(all_preds, all_refs)
+    scores['comet'] = comet_summary(cached_comet_scores(flat_sources, flat_preds, flat_refs, cache=cache, batch_size=args.batch_size))
 
     with open(args.output, "w") as f:
-        json.dump(scores, f, indent=2)
\ No newline at end of file
+        json.dump(scores, f, indent=2)
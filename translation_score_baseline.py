@@ -1,11 +1,9 @@
 #!/usr/bin/env python3
-import evaluate
 import json
 import ipdb
 import pandas as pd
-import sacrebleu
-import numpy as np
-from scipy.stats import bootstrap
+from comet_cache import CometCache
+from translation_score import sacrebleu_scores, cached_comet_scores, comet_summary, comet_version
 
 
 if __name__ == "__main__":
@@ -14,6 +12,7 @@ if __name__ == "__main__":
     parser.add_argument('--source', type=str, required=True, nargs='+', help="Input file for the source language. Use the reference as 'translation'")
     parser.add_argument('--target', type=str, required=True, nargs='+', help="Input file for the target language. Use the reference as reference")
     parser.add_argument('--output', '-o', type=str, required=True, help="Output score file")
+    parser.add_argument('--comet_cache', type=str, default=None, help="SQLite file with the segment-level COMET scores")
     args = parser.parse_args()    
 
     df1 = pd.concat([pd.read_json(f, lines=True) for f in args.source])
@@ -54,28 +53,9 @@ if __name__ == "__main__":
                     flat_preds.append(p)
                     flat_refs.append(refs[i])
                     flat_sources.append(source)
-    scores = {}
-    bleu = sacrebleu.BLEU(lowercase=True)
-    chrf = sacrebleu.CHRF(lowercase=True, word_order=2)
-    ter = sacrebleu.TER(case_sensitive=False, no_punct=True, normalized=True)
-    
-    bleu_scores = bleu.corpus_score(hypotheses=all_preds, references=all_refs, n_bootstrap=1000)
-    chrf_scores = chrf.corpus_score(hypotheses=all_preds, references=all_refs, n_bootstrap=1000)
-    ter_scores = ter.corpus_score(hypotheses=all_preds, references=all_refs, n_bootstrap=1000)
-    bleu_sign = bleu.get_signature().format()
-    chrf_sign = chrf.get_signature().format()
-    ter_sign = ter.get_signature().format()
-
-    scores['bleu'] = json.loads(bleu_scores.format(signature=bleu_sign, is_json=True))
-    scores['chrf++'] = json.loads(chrf_scores.format(signature=chrf_sign, is_json=True))
-    scores['ter'] = json.loads(ter_scores.format(signature=ter_sign, is_json=True))
-    comet = evaluate.load('comet')
-    comet_scores = comet.compute(predictions=flat_preds, references=flat_refs, sources=flat_sources)
-    scores['comet'] = {"score": comet_scores['mean_score']}
-    bs = bootstrap(data=(comet_scores['scores'],), statistic=np.mean, vectorized=True, rng=42, n_resamples=1000)
-    std = bs.standard_error
-    ci_low, ci_high = bs.confidence_interval
-    scores['comet'].update({"std": std, "ci_low": ci_low, "ci_high": ci_high})
+    scores = sacrebleu_scores(all_preds, all_refs)
+    cache = CometCache(args.comet_cache, comet_version()) if args.comet_cache is not None else None
+    scores['comet'] = comet_summary(cached_comet_scores(flat_sources, flat_preds, flat_refs, cache=cache))
 
     with open(args.output, "w") as f:
         json.dump(scores, f, indent=2)
\ No newline at end of file
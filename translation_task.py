@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
-import datasets
+from eval_data import load_eval_dataset
 import pandas as pd
 import itertools
 import tqdm
-from closed_models import ClosedModel, CLOSED_MODELS
+from generation import add_model_args, load_model, generate_resumable, remove_partials
 
 LANG_NAMES = {
     "ita": "Italian",
@@ -12,39 +12,31 @@ LANG_NAMES = {
     "eng": "English",
 }
 
-if __name__ == "__main__":
-    import argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--model', '-m', type=str, required=True, help="Model ID")
-    parser.add_argument('--output_file', '-o', type=str, required=True, help="Output file prefix")    
-    args = parser.parse_args()
-
+def fmt(item_ds, system_prompt, user_prompt):        
+    for item in item_ds:       
+        if system_prompt is None:
+            messages = [
+                {"role": "user", "content": user_prompt.format(item)}
+            ]                
+        else:
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt.format(item)}
+            ]
+        yield messages
 
-    ds = datasets.load_dataset("json", data_files={"dev": "data/pms_dev.jsonl", "devtest": "data/pms_devtest.jsonl"})
-
-    model_id = args.model
-    output_file = args.output_file
-
-    if model_id in CLOSED_MODELS:
-        model = ClosedModel(model_id)
-    else:
-        import transformers
-        import torch
-        model = transformers.pipeline("text-generation", model=model_id, device_map="auto", dtype=torch.bfloat16)
-    
-    def fmt(item_ds, system_prompt, user_prompt):        
-        for item in item_ds:       
-            if system_prompt is None:
-                messages = [
-                    {"role": "user", "content": user_prompt.format(item)}
-                ]                
-            else:
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt.format(item)}
-                ]
-            yield messages
+def translate_unique(model, sentences: list[str], system_prompt: str | None, user_prompt: str, max_new_tokens: int = 100, partial_path: str = None) -> list[str]:
+    """Translate each distinct sentence once and fan the translations back out to all the rows.
+    With `partial_path`, the finished translations are streamed to that file and reused on restart."""
+    unique = list(dict.fromkeys(sentences))
+    msgs = list(fmt(unique, system_prompt, user_prompt))
+    translations = generate_resumable(model, msgs, unique, partial_path, do_sample=False, max_new_tokens=max_new_tokens)
+    return [translations[sentence].strip() for sentence in sentences]
 
+def run_translation(model, model_id: str, ds, output_file: str) -> list[str]:
+    """Translate both splits in all the directions and write one checkpoint per split and direction.
+    Returns the partial files, see remove_partials()."""
+    partial_paths = []
     for from_, to_ in tqdm.tqdm(itertools.permutations(LANG_NAMES.keys(), 2), total=len(LANG_NAMES)*(len(LANG_NAMES)-1)):
         from_lang = LANG_NAMES[from_]
         to_lang = LANG_NAMES[to_]
@@ -60,15 +52,35 @@ if __name__ == "__main__":
         
         for split in ["dev", "devtest"]:
             sentences = list(ds[split][f'flores_{from_}'])
-            answers = []
             references = list(ds[split][f'flores_{to_}'])
             references = [i for i in references]
             splits = [split] * len(sentences)
             ids = ds[split]['flores_id']
-            for answer in model(fmt(ds[split][f'flores_{from_}'], system_prompt, user_prompt), do_sample=False, max_new_tokens=100):
-                tmp = answer[-1]['generated_text'][-1]['content'].strip()
-                answers.append(tmp)
+            # The non-pms sources repeat once per crowdsourced pms translation
+            partial_path = f"{output_file}.{split}.{from_}_{to_}.jsonl.partial"
+            partial_paths.append(partial_path)
+            answers = translate_unique(model, sentences, system_prompt, user_prompt, max_new_tokens=100, partial_path=partial_path)
             df = pd.DataFrame({'split': splits, 'id': ids, 'sentence': sentences, 'reference': references, 'predicted': answers})
 
             df = df.groupby('id').aggregate({i: lambda x: x if i != 'reference' else list for i in df.columns})
             df.to_json(f"{output_file}.{split}.{from_}_{to_}.jsonl", orient='records', lines=True)
+    return partial_paths
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', '-m', type=str, required=True, help="Model ID")
+    parser.add_argument('--output_file', '-o', type=str, required=True, help="Output file prefix")    
+    add_model_args(parser)
+    args = parser.parse_args()
+
+
+    ds = load_eval_dataset()
+
+    model_id = args.model
+    output_file = args.output_file
+
+    model = load_model(model_id, args)
+
+    partial_paths = run_translation(model, model_id, ds, output_file)
+    remove_partials(partial_paths)
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import datasets
+from eval_data import load_split
 import ipdb
 from transformers import AutoTokenizer
 import itertools
@@ -28,7 +28,7 @@ if __name__ == "__main__":
         tokenizer = GPTTokenCounter(model_name=args.model.split("/")[-1])  
     else:
         tokenizer = AutoTokenizer.from_pretrained(args.model)
-    ds = datasets.load_dataset("json", data_files=args.input)["train"]
+    ds = load_split(args.input)
     
     pms_lengths = tokenizer(list(ds['flores_pms']), add_special_tokens=False, return_length=True)[
         "length"